@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+from catalog import combination_column
+
+# IMDb-Bewertungen haben eine Nachkommastelle, ein Bin je 0.1 hält sie exakt
+SCORE_STEP = 0.1
+N_SCORE_BINS = 101
+SCORE_VALUES = np.arange(N_SCORE_BINS) * SCORE_STEP
+# Spalten von stats: alle Zeilen, Zeilen mit Bewertung, Summe und Quadratsumme der Bewertungen
+ROWS, COUNT, SUM, SUMSQ = range(4)
+
+
+class AnalyticsCube:
+    """Vorab aggregierte Kennzahlen über Streaming-Dienst × US/Ausland × Jahr × Genre.
+
+    Jede nicht leere Zelle hält Zeilenzahl, Summe und Quadratsumme der IMDb-Bewertungen und ein
+    Histogramm in Schritten von 0.1. Genres werden wie im Katalog als Kombination geführt, damit ein
+    Film mit mehreren gewählten Genres nur einmal zählt. Anteile, Histogramme, Varianzen und t-Tests
+    für eine Filterauswahl kosten so Zeit proportional zur Zahl der Zellen, nicht der Filme.
+
+    Mit year_bucket=1 hat jedes Jahr eine eigene Zelle und die Kennzahlen decken genau dieselben Filme ab
+    wie FilterIndex.query. Größere Buckets verkleinern den Würfel, erweitern Jahresbereiche aber auf ganze
+    Buckets und liefern dann nur Näherungswerte.
+    """
+
+    def __init__(self, year_bucket=1):
+        self.year_bucket = year_bucket
+        self.services = []
+        self.service_lookup = {}
+        self.combinations = []
+        self.combination_lookup = {}
+        # Eine Zeile je Zelle: Dienst-Code, US, Jahr-Bucket, Code der Genre-Kombination
+        self.cells = np.empty((0, 4), dtype=np.int64)
+        self.stats = np.empty((0, 4))
+        self.histogram = sparse.csr_matrix((0, N_SCORE_BINS), dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        return cls(**kwargs).append(df)
+
+    @staticmethod
+    def encode(column, values, lookup, key=None):
+        # Codes in die eigene Kategorienliste, neue Werte werden hinten angehängt; fehlende Werte bleiben -1
+        categories = [key(value) for value in column.cat.categories] if key else column.cat.categories
+        for value in categories:
+            if value not in lookup:
+                lookup[value] = len(values)
+                values.append(value)
+        mapping = np.array([lookup[value] for value in categories] + [-1], dtype=np.int64)
+        return mapping[column.cat.codes.to_numpy()]
+
+    def append(self, df):
+        """Neue Zeilen (Schema von load_and_prepare_data) in einem vektorisierten Durchlauf einrechnen."""
+        service = self.encode(df['streaming_service'].astype('category'), self.services, self.service_lookup)
+        # Gleiche Genres in anderer Reihenfolge ergeben dieselbe Zelle
+        combination = self.encode(combination_column(df['genres']), self.combinations, self.combination_lookup,
+                                  key=lambda genres: tuple(sorted(genres)))
+        cells = np.column_stack([service, df['US'].to_numpy(dtype=np.int64),
+                                 df['release_year'].to_numpy(dtype=np.int64) // self.year_bucket, combination])
+        keep = (service >= 0) & (combination >= 0)
+        cells = cells[keep]
+        score = df['imdb_score'].to_numpy(dtype=np.float64)[keep]
+        rated = ~np.isnan(score)
+        score = np.where(rated, score, 0.0)
+        row_stats = np.column_stack([np.ones(len(score)), rated, score, score ** 2])
+        bins = np.clip(np.rint(score[rated] / SCORE_STEP), 0, N_SCORE_BINS - 1).astype(np.int64)
+        histogram = sparse.coo_matrix((np.ones(len(bins), dtype=np.int64), (np.flatnonzero(rated), bins)),
+                                      shape=(len(score), N_SCORE_BINS))
+        self.merge(cells, row_stats, histogram)
+        return self
+
+    def merge(self, cells, cell_stats, histogram):
+        # Bestehende und neue Zellen zusammenlegen, gleiche Koordinaten werden aufsummiert
+        cells = np.vstack([self.cells, cells])
+        cell_stats = np.vstack([self.stats, cell_stats])
+        histogram = sparse.vstack([self.histogram, histogram]).tocoo()
+        self.cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        self.stats = np.column_stack([np.bincount(inverse, weights=column, minlength=len(self.cells))
+                                      for column in cell_stats.T]).reshape(len(self.cells), 4)
+        self.histogram = sparse.csr_matrix((histogram.data, (inverse[histogram.row], histogram.col)),
+                                           shape=(len(self.cells), N_SCORE_BINS))
+
+    def cell_mask(self, genres=None, year_range=None, service=None):
+        mask = np.ones(len(self.cells), dtype=bool)
+        if genres:
+            selected = set(genres)
+            matching = np.array([not selected.isdisjoint(combination) for combination in self.combinations], dtype=bool)
+            mask &= matching[self.cells[:, 3]]
+        if year_range:
+            # Jahresbereiche gelten auf Bucket-Ebene, bei year_bucket > 1 zählt ein angeschnittener Bucket ganz
+            mask &= self.cells[:, 2] >= year_range[0] // self.year_bucket
+            mask &= self.cells[:, 2] <= year_range[1] // self.year_bucket
+        if service:
+            mask &= self.cells[:, 0] == self.service_lookup.get(service, -1)
+        return mask
+
+    def aggregate(self, genres=None, year_range=None, rating=None, service=None):
+        """Summen (Dienst × US × stats) und Histogramme (Dienst × US × Bins) für eine Auswahl wie bei FilterIndex.query."""
+        rows = np.flatnonzero(self.cell_mask(genres, year_range, service))
+        groups = self.cells[rows, 0] * 2 + self.cells[rows, 1]
+        group_matrix = sparse.csr_matrix((np.ones(len(rows)), (groups, np.arange(len(rows)))),
+                                         shape=(2 * len(self.services), len(rows)))
+        histogram = np.asarray((group_matrix @ self.histogram[rows]).todense())
+        if rating:
+            # Mit Mindestbewertung stammen alle Kennzahlen aus den Bins ab dieser Bewertung
+            histogram[:, :int(np.ceil(rating / SCORE_STEP - 1e-6))] = 0
+            counts = histogram.sum(axis=1)
+            totals = np.column_stack([counts, counts, histogram @ SCORE_VALUES, histogram @ SCORE_VALUES ** 2])
+        else:
+            totals = group_matrix @ self.stats[rows]
+        return totals.reshape(len(self.services), 2, 4), histogram.reshape(len(self.services), 2, N_SCORE_BINS)
+
+    def summary(self, **selection):
+        """Zeilen, Anzahl, Mittelwert und Varianz (ddof=0) der Bewertungen je Streaming-Dienst × US."""
+        totals, _ = self.aggregate(**selection)
+        index = pd.MultiIndex.from_product([self.services, [0, 1]], names=['streaming_service', 'US'])
+        frame = pd.DataFrame(totals.reshape(-1, 4), index=index, columns=['rows', 'count', 'sum', 'sumsq'])
+        frame['mean'] = frame['sum'] / frame['count']
+        frame['var'] = (frame['sumsq'] / frame['count'] - frame['mean'] ** 2).clip(lower=0)
+        return frame[frame['rows'] > 0].sort_index()
+
+    def foreign_perc(self, **selection):
+        rows = self.summary(**selection)['rows'].unstack(fill_value=0).reindex(columns=[0, 1], fill_value=0)
+        return (rows[0] * 100 / rows.sum(axis=1)).rename('Perc').reset_index()
+
+    def score_histograms(self, us=0, **selection):
+        _, histogram = self.aggregate(**selection)
+        return {service: histogram[code, us] for code, service in enumerate(self.services)}
+
+    def ttest(self, a, b, us=0, alternative='greater', **selection):
+        """Varianzen und t-Test mit gleichen Varianzen für die Bewertungen zweier Dienste."""
+        totals, _ = self.aggregate(**selection)
+        moments = []
+        for service in (a, b):
+            code = self.service_lookup.get(service)
+            # Fehlt der Dienst im Würfel, ergeben NumPy-Nullen wie bei leeren Zellen NaN statt ZeroDivisionError
+            n, total, squares = totals[code, us, [COUNT, SUM, SUMSQ]] if code is not None else np.zeros(3)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = np.float64(total) / n
+                var = max(squares / n - mean ** 2, 0.0) if n else np.nan
+                # ttest_ind_from_stats erwartet die Standardabweichung der Stichprobe (ddof=1)
+                moments.append((mean, np.sqrt(var * n / (n - 1)), n, var))
+        (mean_a, std_a, n_a, var_a), (mean_b, std_b, n_b, var_b) = moments
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = stats.ttest_ind_from_stats(mean_a, std_a, n_a, mean_b, std_b, n_b, equal_var=True,
+                                                alternative=alternative)
+        return {'var_a': var_a, 'var_b': var_b, 't_statistic': result.statistic, 'p_value': result.pvalue}
+
+    def get_stats(self):
+        return {'cells': len(self.cells), 'services': len(self.services), 'genre_combinations': len(self.combinations),
+                'histogram_entries': self.histogram.nnz}
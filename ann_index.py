@@ -0,0 +1,86 @@
+import os
+import pickle
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+from sklearn.random_projection import SparseRandomProjection
+
+
+class AnnIndex:
+    """Approximative Nachbarsuche für sehr große Kataloge.
+
+    TF-IDF- und Metadatenvektoren werden per TruncatedSVD oder zufälliger Projektion auf kompakte
+    float32-Vektoren reduziert, so gewichtet, dass ihr Skalarprodukt den hybriden Score annähert, und
+    mit k-Means in Cluster zerlegt. Eine Anfrage durchsucht nur die n_probe nächsten Cluster.
+    """
+
+    def __init__(self, n_components=128, reducer='svd', n_clusters=None, n_probe=16, random_state=0):
+        self.n_components = n_components
+        self.reducer = reducer
+        self.n_clusters = n_clusters
+        self.n_probe = n_probe
+        self.random_state = random_state
+        self.reducers = None
+        self.vectors = None
+        self.centroids = None
+        self.order = None
+        self.offsets = None
+
+    def make_reducer(self, n_features):
+        n_components = max(1, min(self.n_components, n_features - 1))
+        if self.reducer == 'random':
+            return SparseRandomProjection(n_components=n_components, dense_output=True, random_state=self.random_state)
+        return TruncatedSVD(n_components=n_components, random_state=self.random_state)
+
+    def fit(self, tfidf_matrix, count_normalized, tfidf_weight, count_weight):
+        self.reducers = []
+        parts = []
+        for matrix, weight in ((tfidf_matrix, tfidf_weight), (count_normalized, count_weight)):
+            reducer = self.make_reducer(matrix.shape[1])
+            reduced = normalize(reducer.fit_transform(matrix))
+            self.reducers.append(reducer)
+            parts.append(np.sqrt(weight) * reduced)
+        self.vectors = np.hstack(parts).astype(np.float32)
+
+        n_rows = len(self.vectors)
+        n_clusters = min(self.n_clusters or max(1, int(np.sqrt(n_rows))), n_rows)
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=4096, n_init=3, random_state=self.random_state)
+        labels = kmeans.fit_predict(self.vectors)
+        self.centroids = kmeans.cluster_centers_.astype(np.float32)
+        # Invertierte Listen: Zeilen nach Cluster sortiert, offsets[c]:offsets[c + 1] gehört zu Cluster c
+        self.order = np.argsort(labels, kind='stable').astype(np.int32)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_clusters))]).astype(np.int64)
+        return self
+
+    def candidates(self, row, n_candidates):
+        # Kandidaten aus den n_probe nächsten Clustern, vorsortiert nach dem genäherten Score
+        vector = self.vectors[row]
+        n_probe = min(self.n_probe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ vector), n_probe - 1)[:n_probe]
+        rows = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+        rows = rows[rows != row]
+        scores = self.vectors[rows] @ vector
+        if len(rows) > n_candidates:
+            best = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+            rows, scores = rows[best], scores[best]
+        return rows, scores
+
+    def save(self, directory):
+        np.save(os.path.join(directory, 'ann_vectors.npy'), self.vectors)
+        np.save(os.path.join(directory, 'ann_order.npy'), self.order)
+        with open(os.path.join(directory, 'ann_index.pkl'), 'wb') as f:
+            pickle.dump({'params': (self.n_components, self.reducer, self.n_clusters, self.n_probe, self.random_state),
+                         'reducers': self.reducers, 'centroids': self.centroids, 'offsets': self.offsets}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        with open(os.path.join(directory, 'ann_index.pkl'), 'rb') as f:
+            state = pickle.load(f)
+        index = cls(*state['params'])
+        index.reducers = state['reducers']
+        index.centroids = state['centroids']
+        index.offsets = state['offsets']
+        index.vectors = np.load(os.path.join(directory, 'ann_vectors.npy'), mmap_mode=mmap_mode)
+        index.order = np.load(os.path.join(directory, 'ann_order.npy'), mmap_mode=mmap_mode)
+        return index
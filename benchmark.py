@@ -0,0 +1,217 @@
+"""Reproduzierbare Benchmarks für Empfehlung, Filtersuche und Visualisierung.
+
+Erzeugt synthetische Kataloge im Schema von df_stream.csv und schreibt Laufzeit und Speicherbedarf
+jeder Stufe als JSON, damit Läufe über die Zeit verglichen werden können:
+
+    python benchmark.py --sizes 1000 10000 100000 --output benchmark_results.json
+
+Die Laufzeit jeder Stufe ist der Median aus --repeat Läufen nach --warmup Aufwärmläufen, jeweils ohne
+tracemalloc. Der Spitzenverbrauch stammt aus einem zusätzlichen Lauf mit tracemalloc.
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+GENRES = ['drama', 'comedy', 'thriller', 'action', 'romance', 'crime', 'documentation', 'family', 'fantasy',
+          'horror', 'scifi', 'animation', 'history', 'music', 'war', 'western', 'sport', 'reality']
+SERVICES = ['netflix', 'amazon', 'disney', 'hulu', 'hbo', 'darkmatter', 'paramount', 'crunchyroll', 'rakuten']
+COUNTRIES = ['US', 'GB', 'IN', 'FR', 'DE', 'JP', 'KR', 'ES', 'CA', 'IT']
+STAGES = ['load', 'prepare_data', 'fit', 'recommend', 'filter', 'viz']
+
+
+def generate_catalog(n_rows, seed=0, vocab_size=20000):
+    """Synthetischer Katalog mit n_rows Zeilen im Schema von df_stream.csv."""
+    rng = np.random.default_rng(seed)
+    syllables = np.array(['ka', 'lo', 'mi', 're', 'su', 'ta', 'ne', 'vo', 'ri', 'an', 'el', 'or', 'is', 'um', 'ex'])
+    vocab = np.array([''.join(rng.choice(syllables, rng.integers(2, 5))) for _ in range(vocab_size)])
+    # Wortfrequenzen nach Zipf, wie in natürlicher Sprache
+    cumulative = np.cumsum(1.0 / np.arange(1, vocab_size + 1))
+    cumulative /= cumulative[-1]
+    people = np.array([f'{first} {last}'.title() for first, last in zip(rng.choice(vocab[:2000], 5000), rng.choice(vocab[:2000], 5000))])
+
+    def texts(low, high):
+        # Alle Wörter einer Spalte auf einmal ziehen und danach auf die Zeilen aufteilen
+        lengths = rng.integers(low, high, n_rows)
+        ids = np.minimum(np.searchsorted(cumulative, rng.random(lengths.sum())), vocab_size - 1)
+        return [' '.join(row) for row in np.split(vocab[ids], np.cumsum(lengths)[:-1])]
+
+    def list_repr(values):
+        return str([str(value) for value in values])
+
+    return pd.DataFrame({
+        'type': rng.choice(['MOVIE', 'SHOW'], n_rows, p=[0.7, 0.3]),
+        'title': [title.title() for title in texts(1, 5)],
+        'description': [description + '.' for description in texts(15, 60)],
+        'genres': [list_repr(rng.choice(GENRES, rng.integers(1, 4), replace=False)) for _ in range(n_rows)],
+        'name': [list_repr(rng.choice(people, rng.integers(1, 6))) for _ in range(n_rows)],
+        'primaryName': rng.choice(people, n_rows),
+        'streaming_service': rng.choice(SERVICES, n_rows),
+        'imdb_score': np.round(rng.normal(6.3, 1.1, n_rows).clip(1, 10), 1),
+        'release_year': rng.integers(1920, 2024, n_rows),
+        'budget': np.round(rng.lognormal(16, 1.5, n_rows), -3),
+        'production_countries': [list_repr(rng.choice(COUNTRIES, rng.integers(1, 3), replace=False)) for _ in range(n_rows)],
+    })
+
+
+def measure(results, name, func, *args, setup=None, repeat=3, warmup=1, **kwargs):
+    # Laufzeit ohne tracemalloc messen, der Spitzenverbrauch kommt aus einem eigenen Lauf, weil die
+    # Ablaufverfolgung die Laufzeit um ein Vielfaches verlängert. setup() stellt vor jedem Lauf den
+    # Ausgangszustand wieder her und wird nicht mitgemessen.
+    def run():
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        run()
+    timings = [run() for _ in range(max(repeat, 1))]
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        value = func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    results[name] = {'seconds': float(np.median(timings)), 'seconds_min': min(timings), 'repeat': len(timings),
+                     'peak_bytes': peak, 'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+    return value
+
+
+def run_size(n_rows, seed, stages, n_queries, workdir, repeat=3, warmup=1):
+    from recommendation import MovieRecommender
+    from filter_index import FilterIndex
+    from caching import ResultStore
+    from catalog import load_catalog
+    from memory import memory_report
+    from analytics_cube import AnalyticsCube
+    import data_visualisation as dv
+
+    csv_path = os.path.join(workdir, f'catalog_{n_rows}.csv')
+    generate_catalog(n_rows, seed).to_csv(csv_path, index=False)
+    results = {}
+    stage = functools.partial(measure, results, repeat=repeat, warmup=warmup)
+    rng = np.random.default_rng(seed)
+    model = df = None
+    cache_dir = os.path.join(workdir, f'catalog_cache_{n_rows}')
+    if 'load' in stages:
+        stage('catalog_load_csv', load_catalog, csv_path, cache_dir,
+              setup=lambda: shutil.rmtree(cache_dir, ignore_errors=True))
+        stage('catalog_load_cached', load_catalog, csv_path, cache_dir)
+
+    if {'prepare_data', 'fit', 'recommend'} & set(stages):
+        model = MovieRecommender()
+        movies = load_catalog(csv_path, cache_dir)
+        movies = movies[movies["type"] == "MOVIE"].reset_index(drop=True)
+        stage('prepare_data', model.prepare_data, setup=lambda: setattr(model, 'df', movies))
+        if {'fit', 'recommend'} & set(stages):
+            stage('fit', model.fit)
+        if 'recommend' in stages:
+            # Verschiedene Titel ohne Zurücklegen und vor jedem Lauf ein leerer Cache: gemessen wird der
+            # kalte Pfad. Wiederholte Anfragen aus dem Cache sind eine eigene Stufe.
+            titles = model.df['title'].unique()
+            queries = rng.choice(titles, min(n_queries, len(titles)), replace=False)
+            stage('recommend', lambda: [model.recommend(query) for query in queries], setup=model.cache.clear)
+            results['recommend']['per_query_seconds'] = results['recommend']['seconds'] / len(queries)
+            stage('recommend_cached', lambda: [model.recommend(query) for query in queries])
+            results['recommend_cached']['per_query_seconds'] = results['recommend_cached']['seconds'] / len(queries)
+            stage('recommend_many', model.recommend_many, model.df['title'])
+            # Titelindex gegen process.extract über alle Titel, mit gekürzten Titeln als Tippfehler
+            results['title_index_parity'] = model.title_index.parity_report([query[:-2] for query in queries[:10]])
+
+    if 'filter' in stages or 'viz' in stages:
+        df = dv.MovieRecommenderViz.load_and_prepare_data(csv_path, cache_dir)
+
+    if 'filter' in stages:
+        filter_index = stage('filter_index_build', FilterIndex, df)
+        result_store = ResultStore()
+        # Die Anfragen werden einmal gezogen, damit jeder Lauf dieselbe Arbeit misst
+        selections = []
+        for _ in range(n_queries):
+            low = int(rng.integers(1920, 2020))
+            selections.append({'genres': list(rng.choice(GENRES, 2)), 'year_range': [low, low + 20],
+                               'rating': float(rng.uniform(4, 8)), 'service': str(rng.choice(SERVICES[:7]))})
+
+        def filter_queries():
+            for selection in selections:
+                rows = filter_index.query(**selection)
+                result_store.page(result_store.put(df, rows), 1, 5)
+        stage('filter_query', filter_queries)
+        results['filter_query']['per_query_seconds'] = results['filter_query']['seconds'] / n_queries
+
+    if 'viz' in stages:
+        viz = dv.MovieRecommenderViz
+        for name in ('calculate_foreign_perc', 'plot_kde_plots', 'calculate_variance_and_ttest', 'plot_budget_visualizations'):
+            stage(name, getattr(viz, name), df)
+        analytics_cache = stage('analytics_cache_build', dv.AnalyticsCache, df)
+        stage('analytics_cache_miss', lambda: [analytics_cache.figure(name) for name in dv.AnalyticsCache.FIGURES],
+              setup=analytics_cache.figures.clear)
+        stage('analytics_cache_hit', lambda: [analytics_cache.figure(name) for name in dv.AnalyticsCache.FIGURES])
+
+        selections = []
+        for _ in range(n_queries):
+            low = int(rng.integers(1920, 2020))
+            selections.append({'genres': list(rng.choice(GENRES, 2)), 'year_range': [low, low + 20],
+                               'rating': float(rng.uniform(4, 8))})
+
+        def analytics_queries():
+            # Kennzahlen für zufällige Filterauswahlen direkt aus dem Würfel
+            for selection in selections:
+                analytics_cache.variance_and_ttest(**selection)
+        stage('analytics_query', analytics_queries)
+        results['analytics_query']['per_query_seconds'] = results['analytics_query']['seconds'] / n_queries
+        split = len(df) // 2
+        cube = {}
+        stage('analytics_cube_append', lambda: cube['cube'].append(df.iloc[split:]),
+              setup=lambda: cube.update(cube=AnalyticsCube.from_frame(df.iloc[:split])))
+    # Speicherbilanz von Modell und Katalog nach allen Stufen
+    results['memory'] = memory_report(model=model, catalog=df)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='gemessene Läufe je Stufe')
+    parser.add_argument('--warmup', type=int, default=1, help='Aufwärmläufe je Stufe, nicht gemessen')
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    report = {'created': datetime.now(timezone.utc).isoformat(), 'git_revision': git_revision(),
+              'python': platform.python_version(), 'platform': platform.platform(),
+              'seed': args.seed, 'queries': args.queries, 'repeat': args.repeat, 'warmup': args.warmup, 'runs': []}
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in args.sizes:
+            print(f'Benchmark mit {n_rows} Zeilen ...')
+            stages = run_size(n_rows, args.seed, args.stages, args.queries, workdir, args.repeat, args.warmup)
+            report['runs'].append({'rows': n_rows, 'stages': stages})
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Ergebnisse geschrieben nach {args.output}')
+
+
+if __name__ == '__main__':
+    main()
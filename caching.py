@@ -0,0 +1,98 @@
+import math
+import secrets
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+class LRUCache:
+    """Threadsicherer LRU-Cache mit optionaler Ablaufzeit (TTL in Sekunden) und Zählern."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.entries), "maxsize": self.maxsize, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+class ResultStore:
+    """Serverseitige Suchergebnisse unter einer kurzen ID.
+
+    Gespeichert werden nur der Quell-DataFrame (als Referenz) und ein Array der Zeilenpositionen.
+    Ältere Ergebnisse werden verdrängt, sobald max_entries oder max_rows überschritten sind. Der Speicher
+    gehört einem Prozess, mit mehreren Workern muss der Aufrufer fehlende IDs neu berechnen können.
+    """
+
+    def __init__(self, max_entries=512, max_rows=2_000_000):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.entries = OrderedDict()
+        self.total_rows = 0
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def put(self, frame, rows, result_id=None):
+        # Mit result_id wird ein neu berechnetes Ergebnis unter seiner bisherigen ID abgelegt
+        result_id = result_id or secrets.token_urlsafe(8)
+        rows = np.asarray(rows)
+        with self.lock:
+            previous = self.entries.pop(result_id, None)
+            if previous is not None:
+                self.total_rows -= len(previous[1])
+            self.entries[result_id] = (frame, rows)
+            self.total_rows += len(rows)
+            while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.total_rows > self.max_rows):
+                _, (_, evicted_rows) = self.entries.popitem(last=False)
+                self.total_rows -= len(evicted_rows)
+                self.evictions += 1
+        return result_id
+
+    def get(self, result_id):
+        with self.lock:
+            entry = self.entries.get(result_id)
+            if entry is not None:
+                self.entries.move_to_end(result_id)
+            return entry
+
+    def page(self, result_id, page, page_size):
+        # Liefert nur die Zeilen der angeforderten Seite und die Gesamtzahl der Seiten
+        entry = self.get(result_id)
+        if entry is None:
+            return None
+        frame, rows = entry
+        start = (page - 1) * page_size
+        return frame.iloc[rows[start:start + page_size]], math.ceil(len(rows) / page_size)
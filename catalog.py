@@ -0,0 +1,142 @@
+"""Gemeinsamer Loader für df_stream.csv.
+
+Die CSV wird nur einmal mit festen Datentypen gelesen, Listenspalten werden dabei einmal geparst.
+Das Ergebnis landet spaltenweise als NumPy-Arrays im Cache, spätere Starts lesen nur noch diese.
+
+Wiederholte Werte liegen als Kategorien vor: Streaming-Dienst, Regie und Typ als Strings, Genres und
+Produktionsländer als Tupel je Kombination. Zahlen werden als float32/int16 gehalten.
+"""
+import ast
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import metrics
+
+# Wird erhöht, sobald sich das Format des Caches ändert
+CATALOG_VERSION = 3
+TEXT_COLUMNS = ['title', 'description']
+CATEGORY_COLUMNS = ['type', 'primaryName', 'streaming_service']
+# Listenspalten mit wenigen verschiedenen Kombinationen werden zu Kategorien aus Tupeln
+COMBINATION_COLUMNS = ['genres', 'production_countries']
+NUMERIC_COLUMNS = {'imdb_score': np.float32, 'release_year': np.int16, 'budget': np.float32}
+# Der Cast (name) wird nirgends verwendet und deshalb weder gelesen noch gespeichert
+COLUMNS = ['type', 'title', 'description', 'genres', 'primaryName', 'streaming_service',
+           'imdb_score', 'release_year', 'budget', 'production_countries']
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def parse_list(text):
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return []
+    return value if isinstance(value, list) else []
+
+
+def parse_list_column(column):
+    # Jede unterschiedliche Zeichenkette nur einmal auswerten, bereits geparste Listen bleiben erhalten
+    parsed = {}
+    values = []
+    for value in column:
+        if isinstance(value, str):
+            if value not in parsed:
+                parsed[value] = parse_list(value)
+            value = parsed[value]
+        values.append(value if isinstance(value, list) else [])
+    return pd.Series(values, index=column.index, dtype=object)
+
+
+def combination_column(column):
+    # Bereits kategoriale Spalten bleiben unverändert, sonst Listen parsen und als Tupel kodieren
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column
+    return pd.Series(pd.Categorical([tuple(values) for values in parse_list_column(column)]), index=column.index)
+
+
+def read_csv(csv_path):
+    dtypes = {**{column: str for column in TEXT_COLUMNS + COMBINATION_COLUMNS},
+              **{column: 'category' for column in CATEGORY_COLUMNS}, **NUMERIC_COLUMNS}
+    df = pd.read_csv(csv_path, usecols=COLUMNS, dtype=dtypes)[COLUMNS]
+    for column in COMBINATION_COLUMNS:
+        df[column] = combination_column(df[column])
+    return df
+
+
+def map_categories(column, func):
+    # func nur einmal je verschiedenem Wert anwenden, fehlende Werte werden als NaN übergeben
+    column = column.astype('category')
+    mapped = pd.Index([func(value) for value in column.cat.categories] + [func(np.nan)], tupleize_cols=False)
+    codes, uniques = pd.factorize(mapped)
+    return pd.Series(pd.Categorical.from_codes(codes[column.cat.codes.to_numpy()], uniques), index=column.index)
+
+
+def object_array(values):
+    # Eindimensionales Objekt-Array, auch wenn die Werte Tupel gleicher Länge sind
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def write_cache(df, directory):
+    # Wie beim Modellartefakt: erst temporär schreiben und dann umbenennen
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent)
+    try:
+        for column in TEXT_COLUMNS:
+            np.save(os.path.join(tmp_dir, f'{column}.npy'), df[column].to_numpy(dtype=object))
+        for column in NUMERIC_COLUMNS:
+            np.save(os.path.join(tmp_dir, f'{column}.npy'), df[column].to_numpy())
+        for column in CATEGORY_COLUMNS + COMBINATION_COLUMNS:
+            np.save(os.path.join(tmp_dir, f'{column}_codes.npy'), df[column].cat.codes.to_numpy())
+            np.save(os.path.join(tmp_dir, f'{column}_categories.npy'), object_array(df[column].cat.categories))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'version': CATALOG_VERSION, 'rows': len(df)}, f)
+        if os.path.exists(directory) and not os.path.exists(os.path.join(directory, 'meta.json')):
+            shutil.rmtree(directory)
+        try:
+            os.replace(tmp_dir, directory)
+        except OSError:
+            # Ein anderer Worker hat denselben Cache gleichzeitig geschrieben, sein Ergebnis ist gleichwertig
+            if not os.path.exists(os.path.join(directory, 'meta.json')):
+                raise
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def read_cache(directory):
+    def load(name):
+        return np.load(os.path.join(directory, f'{name}.npy'), allow_pickle=True)
+
+    columns = {}
+    for column in TEXT_COLUMNS + list(NUMERIC_COLUMNS):
+        columns[column] = load(column)
+    for column in CATEGORY_COLUMNS + COMBINATION_COLUMNS:
+        categories = pd.Index(load(f'{column}_categories'), tupleize_cols=False)
+        columns[column] = pd.Categorical.from_codes(load(f'{column}_codes'), categories)
+    return pd.DataFrame(columns)[COLUMNS]
+
+
+@metrics.timed('catalog_load')
+def load_catalog(csv_path, cache_dir='catalog_cache'):
+    """Katalog aus dem Spalten-Cache laden, beim ersten Aufruf aus der CSV erzeugen."""
+    directory = os.path.join(cache_dir, f'{file_hash(csv_path)[:16]}-v{CATALOG_VERSION}')
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        return read_cache(directory)
+    df = read_csv(csv_path)
+    write_cache(df, directory)
+    return df
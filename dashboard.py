@@ -2,47 +2,110 @@ import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 from dash import no_update 
-import pandas as pd
-from recommendation import MovieRecommender  
+import serving
+from filter_index import FilterIndex
+from caching import ResultStore
+from user_store import UserStore
+from taste_profiles import TasteProfiles
+import metrics
+import memory
 import data_visualisation as dv  
 from dash.exceptions import PreventUpdate
+from flask import session
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import math
-import json  
-import sqlite3
 PAGE_SIZE = 5
 
-# Initialisieren der MovieRecommender Instanz und Daten laden
-movie_recommender = MovieRecommender('df_stream.csv')
-movie_recommender.fit()
+# Das Modell wird im Hintergrund gebaut bzw. per mmap geladen, bis dahin gibt es reine Titeltreffer.
+# Neue Versionen werden im laufenden Betrieb ausgetauscht (POST /model/reload oder geänderte CSV).
+model_manager = serving.ModelManager('df_stream.csv', poll_interval=60).start()
+recommendation_service = serving.RecommendationService(model_manager)
 
+# Liest denselben Spalten-Cache wie der Recommender, genres ist bereits eine Liste
 df = dv.MovieRecommenderViz.load_and_prepare_data('df_stream.csv')
+# DataFrame und Filterindex werden nur gemeinsam ausgetauscht, damit die Zeilenpositionen zusammenpassen
+filter_state = (df, FilterIndex(df))
+analytics_cache = dv.AnalyticsCache(df)
+# Suchergebnisse bleiben auf dem Server, im dcc.Store liegen nur die Ergebnis-ID und die Anfrage
+result_store = ResultStore()
 
-def clean_genre(genre_str):
-    return genre_str.strip("[]").replace("'", "").split(', ') if isinstance(genre_str, str) else []
+def refresh_catalog(model, generation):
+    # Das erste Modell passt zum bereits geladenen Katalog, danach den Katalog mit der neuen CSV neu aufbauen
+    global filter_state
+    if generation == 1:
+        return
+    new_df = dv.MovieRecommenderViz.load_and_prepare_data('df_stream.csv')
+    filter_state = (new_df, FilterIndex(new_df))
+    analytics_cache.set_data(new_df)
 
-df['genres'] = df['genres'].apply(clean_genre)
-unique_genres = set(genre for sublist in df['genres'] for genre in sublist)
+model_manager.add_listener(refresh_catalog)
+
+def catalog_options():
+    # Auswahlmöglichkeiten für Genre, Streaming-Dienst und Jahr aus dem aktuell aktiven Katalog
+    catalog_df, filter_index = filter_state
+    year_min, year_max = int(catalog_df['release_year'].min()), int(catalog_df['release_year'].max())
+    return {'genres': [{'label': genre, 'value': genre} for genre in filter_index.genres],
+            'services': [{'label': service, 'value': service} for service in filter_index.services],
+            'year_min': year_min, 'year_max': year_max,
+            'year_marks': {str(year): {'label': str(year), 'style': {'color': 'white'}} for year in range(year_min, year_max + 1, 10)}}
+
+def store_result(frame, rows, query):
+    # Die ID verweist in den Speicher dieses Workers. Die Anfrage wird mitgegeben, damit ein anderer
+    # Worker (gunicorn verteilt die Callbacks beliebig) das Ergebnis beim Blättern neu berechnen kann.
+    return {'id': result_store.put(frame, rows), 'query': query}
+
+def run_query(query):
+    # Ergebnis einer gespeicherten Anfrage in diesem Worker berechnen, None wenn das nicht möglich ist
+    kind = query['kind']
+    if kind == 'filter':
+        catalog_df, filter_index = filter_state
+        return catalog_df, filter_index.query(**query['selection'])
+    if kind == 'recommend':
+        recommendations = recommendation_service.recommend(query['title'])
+        if isinstance(recommendations, str):
+            return None
+        return recommendations, range(len(recommendations))
+    if kind == 'personal':
+        # Der Nutzer kommt aus der signierten Sitzung, nie aus der Anfrage im Browser
+        user_id = session.get('user_id')
+        model, version = model_manager.current()
+        user = user_store.get_user(user_id) if user_id is not None else None
+        if model is None or user is None:
+            return None
+        personal = taste_profiles.recommendations(model, version, user)
+        return personal, range(len(personal))
+    return filter_state[0], []
 
 # Initialisierung der Dash-App, Bootstrap-Thema anpassen
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.LUX])  # Verwendung eines anderen Bootstrap-Themas für eine neue Optik
-# Datenbanktabelle erstellen, wenn sie nicht existiert
-
-#def create_users_table():
-#    conn = sqlite3.connect('userdata.db')
-#    c = conn.cursor()
-#    c.execute('''CREATE TABLE IF NOT EXISTS users
-#                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-#                  username TEXT UNIQUE,
-#                  password TEXT,
-#                  favorite_genre TEXT,
-#                  favorite_streaming_service TEXT)''')
-#    conn.commit()
-#    conn.close()
+# WSGI-Einstiegspunkt für mehrere Worker, z.B. gunicorn --workers 4 --threads 8 dashboard:server
+server = app.server
+# Alle Worker signieren die Sitzungscookies mit demselben Schlüssel
+server.secret_key = serving.secret_key()
+# Datenbanktabelle und Index werden beim Start angelegt, wenn sie nicht existieren
+user_store = UserStore('userdata.db')
+# Persönliche Top-N-Listen je Nutzer, fortgeschrieben bei jeder Suche
+taste_profiles = TasteProfiles(user_store)
 
+# Laufzeitmetriken unter /metrics, Sampling-Profiler unter /metrics/profiler
+metrics.register_routes(app.server)
+# Modellversion unter /model, Neuaufbau per POST /model/reload
+serving.register_routes(app.server, model_manager)
+metrics.registry.register_collector('model', model_manager.get_stats)
+metrics.registry.register_collector('user_store', user_store.get_stats)
+# Die Statistiken folgen immer dem aktuell aktiven Modell
+metrics.registry.register_collector('recommendation_cache', model_manager.cache_stats)
+metrics.registry.register_collector('title_index', model_manager.title_index_stats)
+metrics.registry.register_collector('recommendation_service', recommendation_service.get_stats)
+metrics.registry.register_collector('taste_profiles', taste_profiles.get_stats)
+metrics.registry.register_collector('analytics', analytics_cache.get_stats)
+# Speicherbilanz ohne tiefe Zählung der Strings, damit ein Abruf von /metrics billig bleibt
+metrics.registry.register_collector('memory', lambda: memory.memory_report(deep=False, model=model_manager.model,
+                                                                           catalog=filter_state[0]))
 
-#create_users_table()
+# Startwerte für das Layout, danach hält update_catalog_options die Auswahl aktuell
+options = catalog_options()
 
 app.layout = html.Div([
      dcc.Markdown('''
@@ -83,10 +146,10 @@ app.layout = html.Div([
                         dcc.Input(id='reg-username', type='text', placeholder='Username'),
                         dcc.Input(id='reg-password', type='password', placeholder='Password'),
                         dcc.Dropdown(id='reg-favorite-genre',
-                                     options=[{'label': genre, 'value': genre} for genre in unique_genres],
+                                     options=options['genres'],
                                      placeholder='Bitte wählen Sie Ihr Lieblingsgenre aus', className='mb-3'),
                         dcc.Dropdown(id='reg-favorite-streaming-service',
-                                     options=[{'label': service, 'value': service} for service in df['streaming_service'].unique()],
+                                     options=options['services'],
                                      placeholder='Bitte wählen Sie Ihren Lieblingsstreamingdienst aus', className='mb-3'),
                         html.Button('Register', id='register-button', n_clicks=0, className='mt-3')
                     ])
@@ -109,11 +172,11 @@ app.layout = html.Div([
     dbc.Row([
         dbc.Col([
              html.H4('Genre auswählen', style={'color': 'lightblue'}),  
-            dcc.Dropdown(id='genre-dropdown', options=[{'label': genre, 'value': genre} for genre in unique_genres], multi=True, placeholder='Bitte wählen Sie ein Genre aus', className='dropdown', ),
+            dcc.Dropdown(id='genre-dropdown', options=options['genres'], multi=True, placeholder='Bitte wählen Sie ein Genre aus', className='dropdown', ),
         ], md=4),
         dbc.Col([
             html.H4('Veröffentlichungsjahr', style={'color': 'lightblue'}),  
-            dcc.RangeSlider(id='year-slider', min=df['release_year'].min(), max=df['release_year'].max(), value=[df['release_year'].min(), df['release_year'].max()], marks={str(year): {'label': str(year), 'style': {'color': 'white'}} for year in range(df['release_year'].min(), df['release_year'].max()+1, 10)}, step=1),
+            dcc.RangeSlider(id='year-slider', min=options['year_min'], max=options['year_max'], value=[options['year_min'], options['year_max']], marks=options['year_marks'], step=1),
         ], md=4),
         dbc.Col([
             html.H4('IMDb-Bewertung', style={'color': 'lightblue'}), 
@@ -124,11 +187,14 @@ app.layout = html.Div([
     html.Div(id='foreign-perc-output'),
     dcc.Store(id='last-action-store', storage_type='session'),
     dcc.Store(id='stored-recommendations'),
+    dcc.Store(id='analysis-filter-store'),
+    # Prüft regelmäßig, ob ein ausgetauschter Katalog neue Genres, Dienste oder Jahre mitbringt
+    dcc.Interval(id='catalog-refresh', interval=60 * 1000),
 
     dbc.Row([
         dbc.Col([
             html.H4('Streaming-Dienst auswählen'),
-            dcc.Dropdown(id='streaming-service-dropdown', options=[{'label': service, 'value': service} for service in df['streaming_service'].unique()], placeholder='Bitte wählen Sie einen Streaming-Dienst aus'),
+            dcc.Dropdown(id='streaming-service-dropdown', options=options['services'], placeholder='Bitte wählen Sie einen Streaming-Dienst aus'),
         ], md=6),
         dbc.Col([
             html.Button('Suche starten', id='submit-filter-button', n_clicks=0, className='btn btn-primary mt-4'), 
@@ -156,9 +222,6 @@ app.layout = html.Div([
 ], style={'textAlign': 'center', 'width': '80%', 'height': '100vh', 'minHeight': '100vh', 'margin': '0 auto', 'padding': '20px', 'backgroundImage': 'url(https://repository-images.githubusercontent.com/275336521/20d38e00-6634-11eb-9d1f-6a5232d0f84f)', 'backgroundSize': 'cover', 'backgroundPosition': 'center center', 'color': '#f8f9fa'})
 
 
-def authenticate_user(username, password, cursor):
-    cursor.execute('''SELECT * FROM users WHERE username=? AND password=?''', (username, password))
-    return cursor.fetchone()
 @app.callback(
     [Output('auth-feedback', 'children'),
     Output('genre-dropdown', 'value'),
@@ -181,6 +244,7 @@ def authenticate_user(username, password, cursor):
      State('rating-slider', 'value'), State('streaming-service-dropdown', 'value'),
      State('movie-title-input', 'value'), State('last-action-store', 'data')]
 )
+@metrics.instrument_callback('update_outputs')
 def update_outputs(auth_clicks, register_clicks, reset_clicks, filter_clicks, find_clicks,
                    username, password, reg_username, reg_password, reg_genre, reg_service,
                    genres, year_range, rating, service, movie_title, last_action_data):
@@ -190,20 +254,26 @@ def update_outputs(auth_clicks, register_clicks, reset_clicks, filter_clicks, fi
 
     if button_id == 'auth-button':
         if auth_clicks:
-            conn = sqlite3.connect('userdata.db')
-            c = conn.cursor()
-            user = authenticate_user(username, password, c)
+            user = user_store.authenticate(username, password)
             if user:
                 auth_feedback = html.Div('Authentication successful!', style={'color': 'green'})
                 favorite_genre = user[3]
                 favorite_streaming_service = user[4]
-                conn.close()
+                # Die Anmeldung liegt im signierten Sitzungscookie, der Browser kann die ID nicht ändern
+                session['user_id'] = user[0]
+                model, version = model_manager.current()
+                if model is None:
+                    return (auth_feedback, favorite_genre, favorite_streaming_service,
+                            movie_title, [], [], None, 1, 1)
+                # Persönliche Empfehlungen direkt nach dem Login anzeigen
+                personal = taste_profiles.recommendations(model, version, user)
+                result = store_result(personal, range(len(personal)), {'kind': 'personal'})
                 return (auth_feedback, favorite_genre, favorite_streaming_service,
-                        movie_title, [], [], None, 1, 1)
+                        movie_title, [], [], result, 1, max(math.ceil(len(personal) / PAGE_SIZE), 1))
                 
             else:
                 auth_feedback = html.Div('Invalid username or password. Please try again.', style={'color': 'red'})
-                conn.close()
+                session.pop('user_id', None)
                 return (auth_feedback, dash.no_update, dash.no_update,
                         dash.no_update, dash.no_update, dash.no_update, dash.no_update,
                         dash.no_update, dash.no_update)
@@ -213,16 +283,10 @@ def update_outputs(auth_clicks, register_clicks, reset_clicks, filter_clicks, fi
     elif button_id == 'register-button':
         if register_clicks:
             if reg_username and reg_password and reg_genre and reg_service:
-                conn = sqlite3.connect('userdata.db')
-                c = conn.cursor()
-                try:
-                    c.execute('''INSERT INTO users (username, password, favorite_genre, favorite_streaming_service)
-                                VALUES (?, ?, ?, ?)''', (reg_username, reg_password, reg_genre, reg_service))
-                    conn.commit()
+                if user_store.register(reg_username, reg_password, reg_genre, reg_service):
                     reg_feedback = html.Div('Registration successful!', style={'color': 'green'})
-                except sqlite3.IntegrityError:
+                else:
                     reg_feedback = html.Div('Username already exists. Please choose another one.', style={'color': 'red'})
-                conn.close()
                 return (reg_feedback, dash.no_update, dash.no_update,
                         dash.no_update, dash.no_update, dash.no_update, dash.no_update,
                         dash.no_update, dash.no_update)
@@ -235,31 +299,24 @@ def update_outputs(auth_clicks, register_clicks, reset_clicks, filter_clicks, fi
             raise PreventUpdate
 
     elif button_id == 'reset-button':
-        empty_df = pd.DataFrame(columns=['title', 'description'])  
-        empty_df_json = empty_df.to_json(date_format='iso', orient='split')
-        return ('', [], [], '', html.Div(), html.Div(), empty_df_json, 1, 1)
+        empty_result = store_result(filter_state[0], [], {'kind': 'empty'})
+        return ('', [], [], '', html.Div(), html.Div(), empty_result, 1, 1)
 
     elif button_id == 'submit-filter-button':
-        filtered_df = df.copy()
-        if genres:
-            filtered_df = filtered_df[filtered_df['genres'].apply(lambda x: any(g in genres for g in x))]
-        if year_range:
-            filtered_df = filtered_df[(filtered_df['release_year'] >= year_range[0]) & (filtered_df['release_year'] <= year_range[1])]
-        if rating:
-            filtered_df = filtered_df[filtered_df['imdb_score'] >= rating]
-        if service:
-            filtered_df = filtered_df[filtered_df['streaming_service'] == service]
-
-        if filtered_df.empty:
+        catalog_df, filter_index = filter_state
+        selection = {'genres': genres, 'year_range': year_range, 'rating': rating, 'service': service}
+        filtered_rows = filter_index.query(**selection)
+
+        if len(filtered_rows) == 0:
             return (dash.no_update, dash.no_update, dash.no_update,
                     dash.no_update, no_update, 'Keine Filme gefunden, die den Kriterien entsprechen.',
                     None, dash.no_update, dash.no_update)
         else:
-            recommendations_json = filtered_df.to_json(date_format='iso', orient='split')
-            total_pages = math.ceil(len(filtered_df) / PAGE_SIZE)
+            result = store_result(catalog_df, filtered_rows, {'kind': 'filter', 'selection': selection})
+            total_pages = math.ceil(len(filtered_rows) / PAGE_SIZE)
             return (dash.no_update, dash.no_update, dash.no_update,
                     dash.no_update, no_update, no_update,
-                    recommendations_json, dash.no_update, total_pages)
+                    result, dash.no_update, total_pages)
 
     elif button_id == 'find-recommendations-button':
         if not movie_title:
@@ -268,10 +325,10 @@ def update_outputs(auth_clicks, register_clicks, reset_clicks, filter_clicks, fi
                     no_update, no_update, dash.no_update,
                     dash.no_update, dash.no_update, dash.no_update)
         
-        recommendations = movie_recommender.recommend(movie_title)
+        recommendations = recommendation_service.recommend(movie_title)
         if isinstance(recommendations, str):
-            # Wenn 'recommendations' ein String ist, gibt es keine passenden Empfehlungen.
-            return ('Keine Empfehlungen gefunden.', no_update, no_update,
+            # Wenn 'recommendations' ein String ist, gibt es keine Empfehlungen, z.B. weil das Modell noch geladen wird.
+            return (recommendations, no_update, no_update,
                     no_update, no_update, dash.no_update,
                     dash.no_update, dash.no_update, dash.no_update)
         elif recommendations.empty:
@@ -281,31 +338,67 @@ def update_outputs(auth_clicks, register_clicks, reset_clicks, filter_clicks, fi
                     dash.no_update, dash.no_update, dash.no_update)
         else:
             # Wenn 'recommendations' nicht leer ist, gibt es Empfehlungen.
-            recommendations_json = recommendations.to_json(date_format='iso', orient='split')
+            user_id = session.get('user_id')
+            model, version = model_manager.current()
+            if user_id is not None and model is not None:
+                # Die Suche fließt im Hintergrund in das Geschmacksprofil des angemeldeten Nutzers ein
+                taste_profiles.record_search(model, version, user_id, movie_title)
+            result = store_result(recommendations, range(len(recommendations)),
+                                  {'kind': 'recommend', 'title': movie_title})
             total_pages = math.ceil(len(recommendations) / PAGE_SIZE)
             return (dash.no_update, dash.no_update, dash.no_update,
                     no_update, no_update, no_update,
-                    recommendations_json, dash.no_update, total_pages)
+                    result, dash.no_update, total_pages)
 
     else:
         raise PreventUpdate
 
 
-    
+
+@app.callback(
+    [Output('genre-dropdown', 'options'), Output('reg-favorite-genre', 'options'),
+     Output('streaming-service-dropdown', 'options'), Output('reg-favorite-streaming-service', 'options'),
+     Output('year-slider', 'min'), Output('year-slider', 'max'), Output('year-slider', 'marks'),
+     Output('year-slider', 'value')],
+    [Input('url', 'pathname'), Input('catalog-refresh', 'n_intervals')],
+    [State('genre-dropdown', 'options'), State('streaming-service-dropdown', 'options'),
+     State('year-slider', 'min'), State('year-slider', 'max'), State('year-slider', 'value')]
+)
+def update_catalog_options(pathname, n_intervals, genre_options, service_options, year_min, year_max, year_value):
+    # Das Layout stammt aus dem Katalog beim Start, nach einem Austausch die Auswahl an den neuen anpassen
+    current = catalog_options()
+    if (current['genres'] == genre_options and current['services'] == service_options
+            and (current['year_min'], current['year_max']) == (year_min, year_max)):
+        raise PreventUpdate
+    low, high = year_value or [year_min, year_max]
+    # Eine Auswahl bis an den bisherigen Rand reicht auch bis an den neuen, sonst nur in den neuen Bereich begrenzen
+    low = current['year_min'] if low <= year_min else min(max(low, current['year_min']), current['year_max'])
+    high = current['year_max'] if high >= year_max else max(min(high, current['year_max']), low)
+    return (current['genres'], current['genres'], current['services'], current['services'],
+            current['year_min'], current['year_max'], current['year_marks'], [low, high])
+
+@app.callback(
+    Output('analysis-filter-store', 'data'),
+    [Input('submit-filter-button', 'n_clicks'), Input('reset-button', 'n_clicks')],
+    [State('genre-dropdown', 'value'), State('year-slider', 'value'),
+     State('rating-slider', 'value'), State('streaming-service-dropdown', 'value')]
+)
+def update_analysis_filter(filter_clicks, reset_clicks, genres, year_range, rating, service):
+    # Die Analysen folgen der zuletzt gestarteten Filtersuche, nach dem Zurücksetzen wieder dem ganzen Katalog
+    ctx = dash.callback_context
+    if ctx.triggered[0]['prop_id'].split('.')[0] != 'submit-filter-button' or not filter_clicks:
+        return None
+    return {'genres': genres, 'year_range': year_range, 'rating': rating, 'service': service}
+
 @app.callback(
     Output('analysis-output', 'children'),
-    [Input('analysis-selector', 'value')]
+    [Input('analysis-selector', 'value'), Input('analysis-filter-store', 'data')]
 )
-def update_analysis(selected_analysis):
-    if selected_analysis == 'foreign_perc':
-        fig = dv.MovieRecommenderViz.calculate_foreign_perc(df)
-        return dcc.Graph(figure=fig)
-    elif selected_analysis == 'kde_plots':
-        fig = dv.MovieRecommenderViz.plot_kde_plots(df)
-        return dcc.Graph(figure=fig)
-    elif selected_analysis == 'budget_visualizations':
-        fig = dv.MovieRecommenderViz.plot_budget_visualizations(df)
-        return dcc.Graph(figure=fig)
+@metrics.instrument_callback('update_analysis')
+def update_analysis(selected_analysis, selection):
+    if selected_analysis in dv.AnalyticsCache.FIGURES:
+        # Die Abbildungen werden aus dem Analysewürfel berechnet, nicht aus den gefilterten Zeilen
+        return dcc.Graph(figure=analytics_cache.figure(selected_analysis, **(selection or {})))
     return html.Div()
 
 def generate_movie_tiles(data):
@@ -326,20 +419,23 @@ def generate_movie_tiles(data):
     Output('page-content', 'children'),
     [Input('pagination', 'active_page'), Input('stored-recommendations', 'data')]
 )
+@metrics.instrument_callback('update_page_content')
 def update_page_content_and_pagination(active_page, stored_data):
-    if stored_data is None or stored_data == json.dumps([]):  
+    if stored_data is None:
         raise dash.exceptions.PreventUpdate
-    
-    recommendations = pd.read_json(stored_data, orient='split')
-    total_pages = math.ceil(len(recommendations) / PAGE_SIZE)
-    start_index = (active_page - 1) * PAGE_SIZE
-    end_index = start_index + PAGE_SIZE
-    page_data = recommendations.iloc[start_index:end_index]
-
- 
-    tiles = generate_movie_tiles(page_data)
 
-    return tiles, total_pages
+    # Nur die Zeilen der aktuellen Seite aus dem serverseitigen Ergebnis holen
+    page = result_store.page(stored_data['id'], active_page, PAGE_SIZE)
+    if page is None:
+        # Ergebnis stammt von einem anderen Worker oder wurde verdrängt: unter derselben ID neu berechnen
+        result = run_query(stored_data['query'])
+        if result is None:
+            raise dash.exceptions.PreventUpdate
+        result_store.put(*result, result_id=stored_data['id'])
+        page = result_store.page(stored_data['id'], active_page, PAGE_SIZE)
+    # Die Seitenzahl setzt bereits update_outputs, hier werden nur die Kacheln geliefert
+    page_data, _ = page
+    return generate_movie_tiles(page_data)
 
 
 
@@ -1,62 +1,156 @@
 import numpy as np
 import pandas as pd
 from wordcloud import WordCloud
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
-from cleantext import clean
 import plotly.graph_objects as go
-import string
-from scipy import stats
 import plotly.express as px
+import json
+import threading
+from text_processing import TextPreprocessor, get_preprocessor
+from catalog import load_catalog
+from caching import LRUCache
+from analytics_cube import AnalyticsCube, N_SCORE_BINS, SCORE_STEP, SCORE_VALUES
+import metrics
+
+# Für die Darstellung der Dichte je 0.5 Punkte zu einem Balken zusammenfassen
+KDE_BIN_SIZE = 5
 
 class MovieRecommenderViz:
     @staticmethod
-    def load_and_prepare_data(filepath):
-        df = pd.read_csv(filepath)
+    def load_and_prepare_data(filepath, cache_dir='catalog_cache'):
+        df = load_catalog(filepath, cache_dir)
         df.drop(df[df['streaming_service'].isin(["crunchyroll", "rakuten"])].index, inplace=True)
-        df["US"] = df["production_countries"].apply(lambda x: 1 if 'US' in x else 0)
-        return df
+        df['streaming_service'] = df['streaming_service'].cat.remove_unused_categories()
+        # production_countries ist eine Kategorie aus Tupeln von Ländercodes, geprüft wird je Kombination
+        df["US"] = df["production_countries"].map(lambda x: 1 if 'US' in x else 0).astype(np.int8)
+        # Nur die Spalten behalten, die Dashboard und Analysen verwenden
+        return df[['title', 'description', 'genres', 'streaming_service', 'imdb_score', 'release_year', 'budget', 'US']]
+
+    @staticmethod
+    def compute_aggregates(df):
+        # Analysewürfel in einem Durchlauf, dazu die Top-Budget-Filme, die sich nicht aus Summen ableiten lassen
+        return {'cube': AnalyticsCube.from_frame(df), 'top_budget': MovieRecommenderViz.top_budget(df)}
+
+    @staticmethod
+    def top_budget(df):
+        return df.nlargest(10, 'budget')[['title', 'budget']]
 
     @staticmethod
     def calculate_foreign_perc(df):
-        foreign_perc = df.groupby("streaming_service")["US"].agg(Perc=lambda x: (x.count() - x.sum()) * 100 / x.count()).reset_index()
-        fig = px.bar(foreign_perc, x='streaming_service', y='Perc', title='Prozentuale Verteilung von ausländischen Filmen')
+        return MovieRecommenderViz.foreign_perc_figure(MovieRecommenderViz.compute_aggregates(df))
+
+    @staticmethod
+    def foreign_perc_figure(aggregates, **selection):
+        fig = px.bar(aggregates['cube'].foreign_perc(**selection), x='streaming_service', y='Perc', title='Prozentuale Verteilung von ausländischen Filmen')
         fig.update_layout(xaxis_title='Streaming-Dienst', yaxis_title='Prozent')
         return fig
 
     @staticmethod
     def plot_kde_plots(df):
+        return MovieRecommenderViz.kde_figure(MovieRecommenderViz.compute_aggregates(df))
+
+    @staticmethod
+    def kde_figure(aggregates, **selection):
         fig = go.Figure()
         services = ['netflix', 'amazon', 'disney', 'hulu', 'hbo', 'darkmatter', 'paramount']
+        histograms = aggregates['cube'].score_histograms(us=0, **selection)
+        starts = np.arange(0, N_SCORE_BINS, KDE_BIN_SIZE)
+        width = KDE_BIN_SIZE * SCORE_STEP
         for service in services:
-            service_df = df[(df["US"] == 0) & (df["streaming_service"] == service)]
-            fig.add_trace(go.Histogram(x=service_df['imdb_score'], name=service, histnorm='probability density'))
+            counts = np.add.reduceat(histograms.get(service, np.zeros(N_SCORE_BINS)), starts)
+            # Dichte wie histnorm='probability density': Anteil je Balken geteilt durch die Balkenbreite
+            density = counts / (counts.sum() * width) if counts.sum() else counts
+            fig.add_trace(go.Bar(x=SCORE_VALUES[starts] + width / 2, y=density, width=width, name=service))
         fig.update_layout(title='KDE Plots für verschiedene Streaming-Dienste', xaxis_title='IMDb Score', yaxis_title='Dichte', barmode='overlay')
         fig.update_traces(opacity=0.75)
         return fig
 
     @staticmethod
     def calculate_variance_and_ttest(df):
-        nfx_intl = df[(df["US"] == 0) & (df["streaming_service"] == 'netflix')]
-        amz_intl = df[(df["US"] == 0) & (df["streaming_service"] == 'amazon')]
-        result = stats.ttest_ind(a=nfx_intl['imdb_score'], b=amz_intl['imdb_score'], alternative='greater', equal_var=True)
-        return {'var_nfx': np.var(nfx_intl['imdb_score']), 'var_amz': np.var(amz_intl['imdb_score']), 't_statistic': result.statistic, 'p_value': result.pvalue}
+        return MovieRecommenderViz.variance_and_ttest(MovieRecommenderViz.compute_aggregates(df))
+
+    @staticmethod
+    def variance_and_ttest(aggregates, **selection):
+        # Internationale Filme von Netflix und Amazon, berechnet aus den Zellsummen des Würfels
+        result = aggregates['cube'].ttest('netflix', 'amazon', us=0, alternative='greater', **selection)
+        return {'var_nfx': result['var_a'], 'var_amz': result['var_b'], 't_statistic': result['t_statistic'], 'p_value': result['p_value']}
 
     @staticmethod
     def plot_budget_visualizations(df):
-        df_top_budg = df.sort_values(by='budget', ascending=False).head(10)
-        fig = px.bar(df_top_budg, x='title', y='budget', title='Top Budget Films')
+        return MovieRecommenderViz.budget_figure(MovieRecommenderViz.compute_aggregates(df))
+
+    @staticmethod
+    def budget_figure(aggregates, **selection):
+        # Die zehn teuersten Filme gelten für den ganzen Katalog, unabhängig von der Filterauswahl
+        fig = px.bar(aggregates['top_budget'], x='title', y='budget', title='Top Budget Films')
         fig.update_layout(xaxis_title='Film Title', yaxis_title='Budget')
         return fig
 
     @staticmethod
     def clean_and_process_text(text):
-        text = clean(text, no_emoji=True).lower()
-        text = text.translate(str.maketrans('', '', string.punctuation))
-        stop_words = set(stopwords.words('english'))
-        tokens = word_tokenize(text)
-        tokens = [w for w in tokens if not w in stop_words]
-        lemmatizer = WordNetLemmatizer()
-        lemmas = [lemmatizer.lemmatize(w) for w in tokens]
-        return ' '.join(lemmas)
+        return get_preprocessor(no_emoji=True).process(text)
+
+    @staticmethod
+    def clean_and_process_column(column, n_jobs=1):
+        return TextPreprocessor(no_emoji=True, n_jobs=n_jobs).process_column(column)
+
+
+class AnalyticsCache:
+    """Vorberechnete Kennzahlen und serialisierte Abbildungen je Datenstand und Filterauswahl.
+
+    Die Kennzahlen liegen in einem AnalyticsCube, Abbildungen für eine Auswahl werden aus dessen Zellen
+    berechnet. Bei einem Treffer wird nur das gespeicherte Figure-Dict zurückgegeben.
+    """
+
+    FIGURES = {
+        'foreign_perc': MovieRecommenderViz.foreign_perc_figure,
+        'kde_plots': MovieRecommenderViz.kde_figure,
+        'budget_visualizations': MovieRecommenderViz.budget_figure,
+    }
+
+    def __init__(self, df, max_figures=256):
+        self.lock = threading.Lock()
+        self.version = 0
+        self.figures = LRUCache(maxsize=max_figures)
+        self.set_data(df)
+
+    def set_data(self, df):
+        # Neuer Datenstand: Kennzahlen neu berechnen und alle Abbildungen verwerfen
+        aggregates = MovieRecommenderViz.compute_aggregates(df)
+        with self.lock:
+            self.aggregates = aggregates
+            self.version += 1
+            self.figures.clear()
+
+    def append(self, df):
+        # Neue Zeilen nur in den Würfel einrechnen, der bisherige Bestand wird nicht erneut gelesen
+        with self.lock:
+            self.aggregates['cube'].append(df)
+            self.aggregates['top_budget'] = MovieRecommenderViz.top_budget(pd.concat([self.aggregates['top_budget'], df[['title', 'budget']]]))
+            self.version += 1
+            self.figures.clear()
+
+    @staticmethod
+    def selection_key(selection):
+        # Leere Filter entsprechen keinem Filter, Listen werden für den Schlüssel sortiert
+        return tuple(sorted((name, tuple(sorted(value)) if isinstance(value, (list, tuple)) else value)
+                            for name, value in selection.items() if value))
+
+    def figure(self, name, **selection):
+        with self.lock:
+            key = (self.version, name, self.selection_key(selection))
+            figure = self.figures.get(key)
+            if figure is None:
+                with metrics.timer(f"figure_{name}_build"):
+                    fig = self.FIGURES[name](self.aggregates, **dict(key[2]))
+                    figure = json.loads(fig.to_json())
+                self.figures.put(key, figure)
+            return figure
+
+    def variance_and_ttest(self, **selection):
+        with self.lock:
+            return MovieRecommenderViz.variance_and_ttest(self.aggregates, **dict(self.selection_key(selection)))
+
+    def get_stats(self):
+        with self.lock:
+            stats = self.aggregates['cube'].get_stats()
+        return {**stats, **{f'figures_{name}': value for name, value in self.figures.stats().items()}}
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+
+class FilterIndex:
+    """Einmal aufgebauter Index für die Genre-/Jahr-/Bewertungs-/Streamingdienst-Suche.
+
+    Eine Anfrage kombiniert nur boolesche Masken über kompakte Spalten und liefert Zeilenpositionen,
+    der DataFrame wird nicht kopiert.
+    """
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        genres = df['genres']
+        if isinstance(genres.dtype, pd.CategoricalDtype):
+            # Jede Genre-Kombination nur einmal zerlegen, die Zeilen verweisen über ihren Code darauf
+            combinations, combination_codes = list(genres.cat.categories), genres.cat.codes.to_numpy()
+        else:
+            combinations, combination_codes = list(genres), np.arange(self.n_rows)
+        combinations = [list(combination) if isinstance(combination, (list, tuple)) else [] for combination in combinations]
+        self.genres = sorted({genre for combination in combinations for genre in combination})
+        self.genre_codes = {genre: code for code, genre in enumerate(self.genres)}
+        # Multi-Hot-Genres als Bitmaske, ein uint64-Wort je 64 Genres; die letzte Spalte bleibt leer für Code -1
+        n_words = max(1, (len(self.genres) + 63) // 64)
+        combination_bits = np.zeros((n_words, len(combinations) + 1), dtype=np.uint64)
+        columns = np.repeat(np.arange(len(combinations)), [len(combination) for combination in combinations])
+        codes = np.array([self.genre_codes[genre] for combination in combinations for genre in combination], dtype=np.int64)
+        np.bitwise_or.at(combination_bits, (codes // 64, columns), np.left_shift(np.uint64(1), (codes % 64).astype(np.uint64)))
+        self.genre_bits = combination_bits[:, combination_codes]
+
+        services = pd.Categorical(df['streaming_service'])
+        self.services = list(services.categories)
+        self.service_codes = services.codes
+        self.service_lookup = {service: code for code, service in enumerate(self.services)}
+
+        # Zahlen im Typ des Katalogs (int16/float32), verglichen wird im selben Typ
+        self.release_year = df['release_year'].to_numpy()
+        self.imdb_score = df['imdb_score'].to_numpy()
+
+    def genre_mask(self, genres):
+        codes = {self.genre_codes[genre] for genre in genres if genre in self.genre_codes}
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for word in range(self.genre_bits.shape[0]):
+            selected = np.uint64(sum(1 << (code % 64) for code in codes if code // 64 == word))
+            if selected:
+                mask |= (self.genre_bits[word] & selected) != 0
+        return mask
+
+    def query(self, genres=None, year_range=None, rating=None, service=None):
+        mask = np.ones(self.n_rows, dtype=bool)
+        if genres:
+            mask &= self.genre_mask(genres)
+        if year_range:
+            mask &= self.release_year >= year_range[0]
+            mask &= self.release_year <= year_range[1]
+        if rating:
+            mask &= self.imdb_score >= self.imdb_score.dtype.type(rating)
+        if service:
+            code = self.service_lookup.get(service)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.service_codes == code
+        return np.flatnonzero(mask)
@@ -0,0 +1,65 @@
+"""Speicherbilanz der großen Objekte im Prozess.
+
+Gezählt wird privater Speicher. Per mmap eingeblendete Arrays liegen im Page-Cache, werden von allen
+Workern geteilt und zählen deshalb als 0.
+"""
+import mmap
+import os
+import resource
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def is_mapped(array):
+    # Auch Sichten auf ein memmap (z.B. in einer Sparse-Matrix) gelten als eingeblendet
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def nbytes(obj, deep=True):
+    if isinstance(obj, np.ndarray):
+        return 0 if is_mapped(obj) else obj.nbytes
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        # deep=False zählt Strings nur als Zeiger und ist dafür ohne Python-Schleife
+        usage = obj.memory_usage(deep=deep, index=True)
+        return int(usage.sum()) if isinstance(obj, pd.DataFrame) else int(usage)
+    if sparse.issparse(obj):
+        return sum(nbytes(getattr(obj, name)) for name in ('data', 'indices', 'indptr'))
+    return 0
+
+
+def attribute_bytes(obj, deep=True):
+    # Speicher je Attribut eines Objekts, z.B. MovieRecommender oder FilterIndex
+    usage = {}
+    for name, value in vars(obj).items():
+        size = nbytes(value, deep) or (sum(attribute_bytes(value, deep).values()) if hasattr(value, '__dict__') else 0)
+        if size:
+            usage[name] = size
+    return usage
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Ohne /proc nur der Höchststand (Linux liefert kB)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def memory_report(deep=True, **objects):
+    """Bytes je Objekt und Attribut, etwa memory_report(model=model, catalog=df), plus RSS des Prozesses."""
+    report = {'rss_bytes': rss_bytes()}
+    for name, obj in objects.items():
+        size = nbytes(obj, deep)
+        if size or not hasattr(obj, '__dict__'):
+            report[f'{name}_bytes'] = size
+            continue
+        usage = attribute_bytes(obj, deep)
+        report.update({f'{name}_{attribute}_bytes': value for attribute, value in usage.items()})
+        report[f'{name}_bytes'] = sum(usage.values())
+    return report
@@ -0,0 +1,229 @@
+"""Leichtgewichtige Laufzeitmetriken für Empfehlung und Dash-Callbacks.
+
+Zeiten und Payload-Größen werden in Histogrammen gesammelt und unter /metrics im Prometheus-Textformat
+ausgegeben. Ein optionaler Sampling-Profiler zeichnet die heißesten Stacks aller Threads auf.
+"""
+import bisect
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def render(self, name):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum {self.sum}')
+        lines.append(f'{name}_count {self.count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, prefix='movierecommender', payload_sample_rate=0.1):
+        self.prefix = prefix
+        self.payload_sample_rate = payload_sample_rate
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = Counter()
+        self.collectors = {}
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def register_collector(self, name, collect):
+        # collect() liefert ein Dict mit Zahlenwerten, z.B. die Statistiken eines Caches
+        self.collectors[name] = collect
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f'{name}_seconds', time.perf_counter() - start)
+
+    def timed(self, name):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def instrument_callback(self, name):
+        # Zeit, Aufrufe und (stichprobenartig) die Größe der Antwort eines Dash-Callbacks erfassen
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    status = 'prevented' if type(e).__name__ == 'PreventUpdate' else 'errors'
+                    self.increment(f'callback_{name}_{status}_total')
+                    raise
+                finally:
+                    self.observe(f'callback_{name}_seconds', time.perf_counter() - start)
+                self.increment(f'callback_{name}_calls_total')
+                if random.random() < self.payload_sample_rate:
+                    self.observe(f'callback_{name}_payload_bytes', payload_size(result), SIZE_BUCKETS)
+                return result
+            return wrapper
+        return decorator
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f'{self.prefix}_{name}'
+                lines.append(f'# TYPE {metric} histogram')
+                lines.extend(histogram.render(metric))
+            for name, value in sorted(self.counters.items()):
+                metric = f'{self.prefix}_{name}'
+                lines.append(f'# TYPE {metric} counter')
+                lines.append(f'{metric} {value}')
+            collectors = list(self.collectors.items())
+        for collector_name, collect in collectors:
+            for key, value in sorted(collect().items()):
+                if isinstance(value, (bool, int, float)):
+                    lines.append(f'{self.prefix}_{collector_name}_{key} {float(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def payload_size(result):
+    from plotly.utils import PlotlyJSONEncoder
+    try:
+        return len(json.dumps(result, cls=PlotlyJSONEncoder))
+    except (TypeError, ValueError):
+        return 0
+
+
+class SamplingProfiler:
+    """Zählt in festen Abständen die obersten Stackframes aller Threads.
+
+    Es werden höchstens max_stacks verschiedene Stacks gezählt, weitere Samples landen unter OTHER_STACK.
+    """
+
+    OTHER_STACK = '(other)'
+
+    def __init__(self, interval=0.01, depth=8, max_stacks=10000):
+        self.interval = interval
+        self.depth = depth
+        self.max_stacks = max_stacks
+        self.samples = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+        # Jeder Lauf hat sein eigenes Stopp-Signal, ein schnelles stop()/start() startet so keinen zweiten Sampler
+        self.stopped = threading.Event()
+        self.stopped.set()
+
+    @property
+    def enabled(self):
+        return not self.stopped.is_set()
+
+    def start(self):
+        with self.lock:
+            if self.enabled:
+                return
+            self.stopped = threading.Event()
+            self.thread = threading.Thread(target=self.run, args=(self.stopped,), name='sampling-profiler', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            self.stopped.set()
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+
+    def run(self, stopped):
+        own_id = threading.get_ident()
+        while not stopped.is_set():
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    stack.append(f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}')
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(stack)))
+            with self.lock:
+                for stack in stacks:
+                    if stack not in self.samples and len(self.samples) >= self.max_stacks:
+                        stack = self.OTHER_STACK
+                    self.samples[stack] += 1
+            stopped.wait(self.interval)
+
+    def report(self, limit=50):
+        # Format wie bei "collapsed stacks" (Flamegraph-Werkzeuge): Stack und Anzahl der Samples
+        with self.lock:
+            top = self.samples.most_common(limit)
+        return '\n'.join(f'{stack} {count}' for stack, count in top) + '\n'
+
+
+registry = MetricsRegistry()
+profiler = SamplingProfiler()
+timer = registry.timer
+timed = registry.timed
+instrument_callback = registry.instrument_callback
+
+
+def register_routes(server, metrics_registry=registry, sampling_profiler=profiler):
+    """Hängt /metrics und /metrics/profiler an den Flask-Server der Dash-App."""
+    from flask import Response, request
+
+    @server.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics_registry.render(), mimetype='text/plain')
+
+    @server.route('/metrics/profiler', methods=['GET', 'POST'])
+    def profiler_endpoint():
+        # GET gibt die Stacks aus. Nur per POST: enable=1 startet, enable=0 stoppt, reset=1 verwirft die Samples
+        if request.method == 'POST':
+            enable = request.values.get('enable')
+            if request.values.get('reset') == '1':
+                sampling_profiler.reset()
+            if enable == '1':
+                sampling_profiler.start()
+            elif enable == '0':
+                sampling_profiler.stop()
+        status = 'enabled' if sampling_profiler.enabled else 'disabled'
+        return Response(f'# profiler {status}\n' + sampling_profiler.report(), mimetype='text/plain')
+
+    if os.environ.get('MOVIE_PROFILER') == '1':
+        sampling_profiler.start()
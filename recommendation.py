@@ -1,46 +1,136 @@
 import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
-from sklearn.metrics.pairwise import linear_kernel, cosine_similarity
-from cleantext import clean
+from sklearn.preprocessing import normalize
 import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
-import ast
-import string 
-from fuzzywuzzy import process
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from scipy import sparse
+from text_processing import TextPreprocessor
+from title_index import TitleIndex
+from filter_index import FilterIndex
+from caching import LRUCache
+from fuzzywuzzy import utils
+from ann_index import AnnIndex
+from catalog import load_catalog, file_hash, combination_column, map_categories
+import metrics
+
+# Wird erhöht, sobald sich das Format der gespeicherten Modelle ändert
+ARTIFACT_VERSION = 8
+
+
+def top_k(scores, k):
+    # Partielle Auswahl der k besten Spalten je Zeile, absteigend sortiert (bei Gleichstand kleinerer Index zuerst)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int32), np.empty((scores.shape[0], 0), dtype=np.float32)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+    indices = np.take_along_axis(candidates, order, axis=1)
+    return indices.astype(np.int32), np.take_along_axis(candidate_scores, order, axis=1).astype(np.float32)
+
+
+def merge_top_k(indices, scores, new_indices, new_scores, k):
+    # Bestehende Nachbarlisten mit neuen Kandidaten zusammenführen (gleiche Sortierung wie top_k)
+    indices = np.hstack([indices, new_indices])
+    scores = np.hstack([scores, new_scores])
+    order = np.lexsort((indices, -scores), axis=1)[:, :k]
+    return np.take_along_axis(indices, order, axis=1).astype(np.int32), np.take_along_axis(scores, order, axis=1).astype(np.float32)
+
+
+def save_sparse(directory, name, matrix):
+    matrix = matrix.tocsr()
+    np.save(os.path.join(directory, f"{name}_data.npy"), matrix.data)
+    np.save(os.path.join(directory, f"{name}_indices.npy"), matrix.indices)
+    np.save(os.path.join(directory, f"{name}_indptr.npy"), matrix.indptr)
+    return list(matrix.shape)
+
+
+def load_sparse(directory, name, shape, mmap_mode):
+    # Die Arrays werden nicht kopiert, die CSR-Matrix liest direkt aus den gemappten Dateien
+    data = np.load(os.path.join(directory, f"{name}_data.npy"), mmap_mode=mmap_mode)
+    indices = np.load(os.path.join(directory, f"{name}_indices.npy"), mmap_mode=mmap_mode)
+    indptr = np.load(os.path.join(directory, f"{name}_indptr.npy"), mmap_mode=mmap_mode)
+    return sparse.csr_matrix((data, indices, indptr), shape=tuple(shape), copy=False)
+
 
 class MovieRecommender:
-    def __init__(self, df_stream_dir_path):
-        self.df = pd.read_csv(df_stream_dir_path)
-        self.df = self.df[self.df["type"] == "MOVIE"].reset_index(drop=True)
-        self.prepare_data()
+    def __init__(self, df_stream_dir_path=None, n_neighbors=50, block_size=256, n_jobs=1, drift_threshold=0.2,
+                 cache_size=1024, cache_ttl=3600, mode="exact", ann_params=None, ann_candidates=300):
+        self.df = None
+        self.preprocessor = TextPreprocessor(n_jobs=n_jobs)
         self.tfidf = TfidfVectorizer()
         self.count = CountVectorizer()
         self.tfidf_matrix = None
         self.count_matrix = None
-        self.hybrid_cosine_sim = None
+        self.count_normalized = None
+        # Gewichtungsfaktoren für den hybriden Score
+        self.tfidf_weight = 2
+        self.count_weight = 1
+        # Top-k Nachbarindex statt der dichten N×N Ähnlichkeitsmatrix
+        self.n_neighbors = n_neighbors
+        self.block_size = block_size
+        self.neighbor_indices = None
+        self.neighbor_scores = None
+        # mode="ann": approximative Suche über AnnIndex statt vollständiger Nachbarlisten. Die besten
+        # ann_candidates Kandidaten werden exakt nachbewertet (0 = nur genäherte Scores).
+        self.mode = mode
+        self.ann_params = ann_params or {}
+        self.ann_candidates = ann_candidates
+        self.ann_index = None
+        self.title_index = None
+        self.title_rows = None
+        self.filter_index = None
+        # Inkrementelle Aktualisierung: ab diesem Anteil geänderter Filme wird komplett neu trainiert
+        self.drift_threshold = drift_threshold
+        self.fitted_rows = 0
+        self.changed_rows = 0
+        # Ergebnis-Cache für recommend(), wird bei jeder Änderung am Modell geleert
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
         # Vorbereitung der NLTK-Ressourcen
         #nltk.download('stopwords')
         #nltk.download('punkt')
         #nltk.download('wordnet')
+        if df_stream_dir_path is not None:
+            self.load_csv(df_stream_dir_path)
+
+    def load_csv(self, df_stream_dir_path):
+        # Gemeinsamer Spalten-Cache mit der Visualisierung, Listenspalten sind bereits geparst
+        self.df = load_catalog(df_stream_dir_path)
+        self.df = self.df[self.df["type"] == "MOVIE"].reset_index(drop=True)
+        self.prepare_data()
 
+    @metrics.timed("recommender_prepare_data")
     def prepare_data(self):
-        self.df = self.df[["title", "description", "genres", "name", "primaryName"]].copy()
-        self.df["description"] = self.df["description"].apply(self.preprocess_text)
-        self.df["genres"] = self.df["genres"].apply(self.literally)
-        self.df["name"] = self.df["name"].apply(self.lower_strip).apply(lambda x: self.top_cast(x, 1))
-        self.df["primaryName"] = self.df["primaryName"].apply(self.lower_strip_str)
-        self.df["soup"] = self.df.apply(self.metadata_soup, axis=1)
+        self.df = self.prepare_frame(self.df)
+
+    def prepare_frame(self, df):
+        # Streaming-Dienst, Jahr und Bewertung werden nur für die Filtermaske gebraucht
+        df = df[["title", "description", "genres", "primaryName",
+                 "streaming_service", "release_year", "imdb_score"]].copy()
+        df["description"] = self.preprocessor.process_column(df["description"])
+        # Kompakt: Genres als Kategorie je Kombination. Der Cast kam bisher ungeparst an, lower_strip() lieferte ''
+        # und kein Darsteller ging in die Metadaten ein. Damit die Empfehlungen gleich bleiben, fehlt er ganz.
+        df["genres"] = combination_column(df["genres"])
+        df["primaryName"] = map_categories(df["primaryName"], self.lower_strip_str)
+        return self.compact_frame(df)
+
+    def compact_frame(self, df):
+        # Nach pd.concat werden Kategorien mit unterschiedlichen Werten zu object, daher erneut umwandeln
+        for column in ("genres", "primaryName", "streaming_service"):
+            if not isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype("category")
+        return df.astype({"release_year": np.int16, "imdb_score": np.float32})
 
     def preprocess_text(self, text):
         # Kombinierte Vorverarbeitungsfunktionen ohne den no_emoji-Parameter
-        text = clean(text).lower().translate(str.maketrans('', '', string.punctuation))
-        stop_words = set(stopwords.words("english"))
-        tokens = word_tokenize(text)
-        filtered = [WordNetLemmatizer().lemmatize(w) for w in tokens if not w in stop_words]
-        return ' '.join(filtered)
+        return self.preprocessor.process(text)
 
 
     def lower_strip(self, text_lst):
@@ -60,54 +150,400 @@ class MovieRecommender:
             text = ''
         return text
 
-    def literally(self, text):
-        try:
-            text = ast.literal_eval(text)
-        except:
-            text = float('nan')
-        return text
-
     def top_cast(self, cast, n):
         return cast[:n] if len(cast) > n else cast
 
     def metadata_soup(self, df):
-        return " ".join(df["genres"]) + " " + " ".join(df["name"]) + " " + df["primaryName"]
+        # Wird nur für fit()/add_movies() gebildet und nicht im DataFrame gehalten
+        genres = map_categories(df["genres"], lambda genres: " ".join(genres) if isinstance(genres, tuple) else "")
+        return genres.astype(str) + " " + df["primaryName"].astype(str)
 
+    @metrics.timed("recommender_fit")
     def fit(self):
         self.tfidf_matrix = self.tfidf.fit_transform(self.df["description"])
-        self.count_matrix = self.count.fit_transform(self.df['soup'])
-        tfidf_cosine_sim = linear_kernel(self.tfidf_matrix, self.tfidf_matrix)
-        count_cosine_sim = cosine_similarity(self.count_matrix, self.count_matrix)
-        A, B = 2, 1  # Gewichtungsfaktoren
-        self.hybrid_cosine_sim = A * tfidf_cosine_sim + B * count_cosine_sim
+        self.count_matrix = self.count.fit_transform(self.metadata_soup(self.df))
+        self.count_normalized = normalize(self.count_matrix)
+        if self.mode == "ann":
+            self.build_ann_index()
+        else:
+            self.build_neighbors()
+        self.build_lookups()
+        self.fitted_rows = len(self.df)
+        self.changed_rows = 0
+        self.cache.clear()
+
+    def build_lookups(self):
+        titles = self.df['title'].tolist()
+        self.title_index = TitleIndex(titles)
+        # Titel -> erste Zeile mit diesem Titel
+        self.title_rows = {}
+        for row, title in enumerate(titles):
+            self.title_rows.setdefault(title, row)
+        self.filter_index = FilterIndex(self.df)
+
+    @metrics.timed("recommender_build_neighbors")
+    def build_neighbors(self):
+        # Nachbarn werden blockweise berechnet, der Speicherbedarf ist durch block_size × N begrenzt
+        n_rows = self.tfidf_matrix.shape[0]
+        k = min(self.n_neighbors, max(n_rows - 1, 0))
+        self.neighbor_indices = np.empty((n_rows, k), dtype=np.int32)
+        self.neighbor_scores = np.empty((n_rows, k), dtype=np.float32)
+        transposed = self.transposed_matrices()
+        for start in range(0, n_rows, self.block_size):
+            rows = np.arange(start, min(start + self.block_size, n_rows))
+            indices, scores = self.top_neighbors(rows, k, transposed)
+            self.neighbor_indices[rows] = indices
+            self.neighbor_scores[rows] = scores
+
+    @metrics.timed("recommender_build_ann_index")
+    def build_ann_index(self):
+        self.ann_index = AnnIndex(**self.ann_params).fit(
+            self.tfidf_matrix, self.count_normalized, self.tfidf_weight, self.count_weight)
+
+    def transposed_matrices(self):
+        # Einmal je Aufbau transponieren statt in jedem Block erneut (O(nnz) pro Transposition)
+        return self.tfidf_matrix.T.tocsr(), self.count_normalized.T.tocsr()
+
+    def hybrid_scores(self, rows, transposed=None):
+        # Hybride Ähnlichkeit (TF-IDF + Cosinus der Metadaten) der angegebenen Zeilen gegen alle Filme
+        tfidf_t, count_t = transposed if transposed is not None else self.transposed_matrices()
+        tfidf_sim = self.tfidf_matrix[rows] @ tfidf_t
+        count_sim = self.count_normalized[rows] @ count_t
+        return (self.tfidf_weight * tfidf_sim + self.count_weight * count_sim).toarray()
+
+    def hybrid_scores_for(self, row, candidates):
+        # Exakter hybrider Score eines Films gegen ausgewählte Kandidaten
+        tfidf_sim = self.tfidf_matrix[candidates] @ self.tfidf_matrix[row].T
+        count_sim = self.count_normalized[candidates] @ self.count_normalized[row].T
+        return (self.tfidf_weight * tfidf_sim + self.count_weight * count_sim).toarray().ravel()
+
+    def ann_neighbors(self, row, k):
+        candidates, scores = self.ann_index.candidates(row, max(self.ann_candidates, k))
+        if self.ann_candidates:
+            scores = self.hybrid_scores_for(row, candidates)
+        order = np.lexsort((candidates, -scores))[:k]
+        return candidates[order], scores[order]
+
+    def ann_recall_report(self, n_queries=200, k=10, random_state=0):
+        # recall@k des ANN-Modus gegen die exakten hybriden Scores für zufällige Filme
+        rng = np.random.default_rng(random_state)
+        rows = rng.choice(len(self.df), min(n_queries, len(self.df)), replace=False)
+        start = time.perf_counter()
+        transposed = self.transposed_matrices()
+        exact = [self.top_neighbors(rows[i:i + self.block_size], k, transposed)[0]
+                 for i in range(0, len(rows), self.block_size)]
+        exact = np.vstack(exact)
+        exact_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        approximate = [self.ann_neighbors(row, k)[0] for row in rows]
+        ann_seconds = time.perf_counter() - start
+        hits = [len(set(found) & set(expected)) / max(len(expected), 1) for found, expected in zip(approximate, exact)]
+        return {"k": k, "queries": len(rows), f"recall_at_{k}": float(np.mean(hits)),
+                "exact_seconds_per_query": exact_seconds / len(rows), "ann_seconds_per_query": ann_seconds / len(rows)}
 
-    def recommend(self, search_query):
+    def profile_scores(self, tfidf_vector, count_vector):
+        # Ein Produkt Matrix × Vektor je Teilraum bewertet den ganzen Katalog gegen ein Nutzerprofil
+        tfidf_sim = self.tfidf_matrix @ tfidf_vector.T
+        count_sim = self.count_normalized @ count_vector.T
+        return (self.tfidf_weight * tfidf_sim + self.count_weight * count_sim).toarray().ravel()
+
+    def top_neighbors(self, rows, k, transposed=None):
+        rows = np.asarray(rows)
+        scores = self.hybrid_scores(rows, transposed)
+        # Der Film selbst wird nicht empfohlen
+        scores[np.arange(len(rows)), rows] = -np.inf
+        return top_k(scores, k)
+
+    def needs_refit(self, n_changed):
+        return self.changed_rows + n_changed > self.drift_threshold * self.fitted_rows
+
+    @metrics.timed("recommender_add_movies")
+    def add_movies(self, rows):
+        # Neue Filme (Zeilen im Schema von df_stream.csv) ohne kompletten Neuaufbau aufnehmen
+        new_df = pd.DataFrame(rows)
+        if "type" in new_df.columns:
+            new_df = new_df[new_df["type"] == "MOVIE"]
+        if new_df.empty:
+            return 0
+        new_df = self.prepare_frame(new_df.reset_index(drop=True))
+        if self.needs_refit(len(new_df)):
+            self.df = self.compact_frame(pd.concat([self.df, new_df], ignore_index=True))
+            self.fit()
+            return len(new_df)
+
+        n_old = len(self.df)
+        n_total = n_old + len(new_df)
+        self.extend_vocabulary(self.tfidf, new_df["description"], n_total)
+        new_soup = self.metadata_soup(new_df)
+        self.extend_vocabulary(self.count, new_soup)
+        new_tfidf = self.project_tfidf(new_df["description"])
+        new_count = self.count.transform(new_soup)
+        self.tfidf_matrix = self.append_rows(self.tfidf_matrix, new_tfidf)
+        self.count_matrix = self.append_rows(self.count_matrix, new_count)
+        self.count_normalized = self.append_rows(self.count_normalized, normalize(new_count))
+        self.df = self.compact_frame(pd.concat([self.df, new_df], ignore_index=True))
+        self.changed_rows += len(new_df)
+        if self.mode == "ann":
+            self.build_ann_index()
+        else:
+            self.add_neighbors(n_old)
+
+        new_titles = new_df["title"].tolist()
+        self.title_index.add(new_titles)
+        for row, title in enumerate(new_titles, start=n_old):
+            self.title_rows.setdefault(title, row)
+        self.filter_index = FilterIndex(self.df)
+        self.cache.clear()
+        return len(new_df)
+
+    @metrics.timed("recommender_remove_movies")
+    def remove_movies(self, titles):
+        remove = self.df["title"].isin(titles).to_numpy()
+        n_removed = int(remove.sum())
+        if n_removed == 0:
+            return 0
+        keep = np.flatnonzero(~remove)
+        self.df = self.df.iloc[keep].reset_index(drop=True)
+        if self.needs_refit(n_removed):
+            self.fit()
+            return n_removed
+
+        self.tfidf_matrix = self.tfidf_matrix[keep]
+        self.count_matrix = self.count_matrix[keep]
+        self.count_normalized = self.count_normalized[keep]
+        self.changed_rows += n_removed
+        if self.mode == "ann":
+            self.build_ann_index()
+            self.build_lookups()
+            self.cache.clear()
+            return n_removed
+
+        # Alte Zeilennummern auf neue abbilden, entfernte Filme werden zu -1
+        remap = np.full(len(remove), -1, dtype=np.int32)
+        remap[keep] = np.arange(len(keep), dtype=np.int32)
+        indices = remap[np.asarray(self.neighbor_indices)[keep]]
+        scores = np.asarray(self.neighbor_scores)[keep]
+        k = min(self.n_neighbors, max(len(keep) - 1, 0))
+        # Nur Filme, deren Nachbarliste einen entfernten Film enthielt, werden neu berechnet
+        affected = np.flatnonzero((indices < 0).any(axis=1))
+        self.neighbor_indices = np.ascontiguousarray(indices[:, :k])
+        self.neighbor_scores = np.ascontiguousarray(scores[:, :k])
+        transposed = self.transposed_matrices() if len(affected) else None
+        for start in range(0, len(affected), self.block_size):
+            block = affected[start:start + self.block_size]
+            self.neighbor_indices[block], self.neighbor_scores[block] = self.top_neighbors(block, k, transposed)
+
+        # Titelindex und Titelzuordnung hängen an den Zeilennummern und werden neu aufgebaut
+        self.build_lookups()
+        self.cache.clear()
+        return n_removed
+
+    def extend_vocabulary(self, vectorizer, texts, n_docs=None):
+        # Neue Begriffe hinten an das Vokabular anhängen; bestehende Spalten bleiben unverändert
+        analyzer = vectorizer.build_analyzer()
+        doc_freq = {}
+        for text in texts:
+            for term in set(analyzer(text)):
+                if term not in vectorizer.vocabulary_:
+                    doc_freq[term] = doc_freq.get(term, 0) + 1
+        if not doc_freq:
+            return
+        new_terms = sorted(doc_freq)
+        for term in new_terms:
+            vectorizer.vocabulary_[term] = len(vectorizer.vocabulary_)
+        if n_docs is not None:
+            # Geglättete IDF wie im TfidfTransformer, berechnet mit dem aktuellen Katalogumfang
+            new_idf = np.log((1 + n_docs) / (1 + np.array([doc_freq[term] for term in new_terms]))) + 1
+            vectorizer.idf_ = np.concatenate([vectorizer.idf_, new_idf])
+
+    def project_tfidf(self, texts):
+        # Entspricht tfidf.transform(), funktioniert aber auch mit erweitertem Vokabular
+        counts = CountVectorizer.transform(self.tfidf, texts)
+        return normalize(counts @ sparse.diags(self.tfidf.idf_))
+
+    def append_rows(self, matrix, new_rows):
+        matrix = sparse.csr_matrix(matrix)
+        matrix.resize(matrix.shape[0], new_rows.shape[1])
+        return sparse.vstack([matrix, new_rows], format="csr")
+
+    def add_neighbors(self, n_old):
+        n_total = self.tfidf_matrix.shape[0]
+        k = min(self.n_neighbors, n_total - 1)
+        if n_old == 0 or k == 0:
+            self.build_neighbors()
+            return
+        indices = np.zeros((n_total, k), dtype=np.int32)
+        scores = np.full((n_total, k), -np.inf, dtype=np.float32)
+        k_old = self.neighbor_indices.shape[1]
+        indices[:n_old, :k_old] = self.neighbor_indices
+        scores[:n_old, :k_old] = self.neighbor_scores
+        transposed = self.transposed_matrices()
+        for start in range(n_old, n_total, self.block_size):
+            rows = np.arange(start, min(start + self.block_size, n_total))
+            block = self.hybrid_scores(rows, transposed)
+            # Bestehende Filme: nur Listen anpassen, in die einer der neuen Filme aufrückt
+            old_scores = block[:, :n_old].T
+            affected = np.flatnonzero(old_scores.max(axis=1) > scores[:n_old, -1])
+            indices[affected], scores[affected] = merge_top_k(
+                indices[affected], scores[affected],
+                np.broadcast_to(rows, (len(affected), len(rows))), old_scores[affected], k)
+            # Neue Filme: Nachbarn gegen den gesamten Katalog
+            block[np.arange(len(rows)), rows] = -np.inf
+            indices[rows], scores[rows] = top_k(block, k)
+        self.neighbor_indices = indices
+        self.neighbor_scores = scores
+
+    def model_settings(self):
+        # Alle Einstellungen, die das Ergebnis von fit() beeinflussen
+        return {"n_neighbors": self.n_neighbors, "tfidf_weight": self.tfidf_weight,
+                "count_weight": self.count_weight, "mode": self.mode, "ann_params": self.ann_params,
+                "artifact_version": ARTIFACT_VERSION}
+
+    def cache_key(self, df_stream_dir_path):
+        sha = hashlib.sha256(file_hash(df_stream_dir_path).encode())
+        sha.update(json.dumps(self.model_settings(), sort_keys=True).encode())
+        return sha.hexdigest()[:16]
+
+    @metrics.timed("recommender_save")
+    def save(self, artifact_dir):
+        # Erst in ein temporäres Verzeichnis schreiben und dann umbenennen, damit andere Prozesse nie ein halbes Artefakt sehen
+        parent = os.path.dirname(os.path.abspath(artifact_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+        try:
+            self.df.to_pickle(os.path.join(tmp_dir, "df.pkl"))
+            with open(os.path.join(tmp_dir, "vectorizers.pkl"), "wb") as f:
+                pickle.dump({"tfidf": self.tfidf, "count": self.count}, f)
+            meta = {"settings": self.model_settings(), "shapes": {},
+                    "fitted_rows": self.fitted_rows, "changed_rows": self.changed_rows}
+            for name in ("tfidf_matrix", "count_matrix", "count_normalized"):
+                meta["shapes"][name] = save_sparse(tmp_dir, name, getattr(self, name))
+            if self.mode == "ann":
+                self.ann_index.save(tmp_dir)
+            else:
+                np.save(os.path.join(tmp_dir, "neighbor_indices.npy"), self.neighbor_indices)
+                np.save(os.path.join(tmp_dir, "neighbor_scores.npy"), self.neighbor_scores)
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            if os.path.exists(artifact_dir):
+                shutil.rmtree(artifact_dir)
+            os.rename(tmp_dir, artifact_dir)
+        except OSError:
+            # Ein anderer Prozess hat das Artefakt gleichzeitig geschrieben
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.exists(os.path.join(artifact_dir, "meta.json")):
+                raise
+
+    @classmethod
+    @metrics.timed("recommender_load")
+    def load(cls, artifact_dir, mmap=True, **kwargs):
+        mmap_mode = "r" if mmap else None
+        with open(os.path.join(artifact_dir, "meta.json")) as f:
+            meta = json.load(f)
+        settings = meta["settings"]
+        if settings.get("artifact_version") != ARTIFACT_VERSION:
+            raise ValueError(f"Inkompatibles Modellartefakt in {artifact_dir}")
+        kwargs.update(n_neighbors=settings["n_neighbors"], mode=settings["mode"], ann_params=settings["ann_params"])
+        model = cls(**kwargs)
+        model.tfidf_weight = settings["tfidf_weight"]
+        model.count_weight = settings["count_weight"]
+        model.df = pd.read_pickle(os.path.join(artifact_dir, "df.pkl"))
+        with open(os.path.join(artifact_dir, "vectorizers.pkl"), "rb") as f:
+            vectorizers = pickle.load(f)
+        model.tfidf = vectorizers["tfidf"]
+        model.count = vectorizers["count"]
+        for name, shape in meta["shapes"].items():
+            setattr(model, name, load_sparse(artifact_dir, name, shape, mmap_mode))
+        if model.mode == "ann":
+            model.ann_index = AnnIndex.load(artifact_dir, mmap_mode=mmap_mode)
+        else:
+            model.neighbor_indices = np.load(os.path.join(artifact_dir, "neighbor_indices.npy"), mmap_mode=mmap_mode)
+            model.neighbor_scores = np.load(os.path.join(artifact_dir, "neighbor_scores.npy"), mmap_mode=mmap_mode)
+        model.build_lookups()
+        model.fitted_rows = meta["fitted_rows"]
+        model.changed_rows = meta["changed_rows"]
+        return model
+
+    @classmethod
+    def from_cache(cls, df_stream_dir_path, cache_dir="model_cache", **kwargs):
+        # Warmstart: gültiges Artefakt laden und prepare_data()/fit() komplett überspringen
+        model = cls(**kwargs)
+        artifact_dir = os.path.join(cache_dir, model.cache_key(df_stream_dir_path))
+        if os.path.exists(os.path.join(artifact_dir, "meta.json")):
+            return cls.load(artifact_dir, **kwargs)
+        model.load_csv(df_stream_dir_path)
+        model.fit()
+        model.save(artifact_dir)
+        return model
+
+    @metrics.timed("recommender_recommend")
+    def recommend(self, search_query, k=10):
         if not isinstance(search_query, str):
             return "Ungültige Suche. Bitte versuchen Sie es erneut"
-        # Suche nach den am besten passenden Titeln im DataFrame
-        titles = self.df['title'].tolist()
-        # Findet die besten Übereinstimmungen für den gegebenen Suchbegriff
-        closest_matches = process.extract(search_query, titles, limit=10)
+        # Die unscharfe Suche hängt nur vom normalisierten Suchbegriff ab
+        key = (utils.full_process(search_query, force_ascii=True), k)
+        recommendations = self.cache.get(key)
+        if recommendations is None:
+            metrics.registry.increment("recommender_cache_misses_total")
+            recommendations = self.compute_recommendations(search_query, k)
+            self.cache.put(key, recommendations)
+        else:
+            metrics.registry.increment("recommender_cache_hits_total")
+        return recommendations.copy()
+
+    def compute_recommendations(self, search_query, k):
+        # Findet die besten Übereinstimmungen für den gegebenen Suchbegriff über den Titelindex
+        with metrics.timer("recommender_fuzzy_match"):
+            closest_matches = self.title_index.extract(search_query, limit=10)
         matched_titles = [match[0] for match in closest_matches]
         
-        # Filtert den DataFrame, um nur Filme mit passenden Titeln einzubeziehen
-        matched_df = self.df[self.df['title'].isin(matched_titles)]
-        
-        if matched_df.empty:
+        rows = [self.title_rows[title] for title in matched_titles if title in self.title_rows]
+        if not rows:
             # Keine Empfehlungen gefunden, gebe eine leere Liste oder eine Fehlermeldung zurück
             return pd.DataFrame(columns=["title", "description"])
-        
-        # Berechnung der Empfehlungen basierend auf den gefilterten Filmen
-        recommendations = []
-        for title in matched_titles:
-            index = matched_df[matched_df['title'] == title].index[0]
-            similarity_scores = pd.Series(self.hybrid_cosine_sim[index]).sort_values(ascending=False)
-            top_indices = similarity_scores.iloc[1:11].index  # Die Top 10 Empfehlungen, ohne den Film selbst
-            recommendations.append(self.df.iloc[top_indices][["title", "description"]])
-        
-        # Kombiniere alle gefundenen Empfehlungen in einem DataFrame
-        final_recommendations = pd.concat(recommendations).drop_duplicates().head(10)
-        return final_recommendations
 
+        # Die Top k Empfehlungen je Treffer als ein Block, Reihenfolge der Treffer bleibt erhalten
+        with metrics.timer("recommender_similarity_lookup"):
+            indices, _ = self.neighbors_for_rows(np.asarray(rows), k)
+            indices = indices[indices >= 0]
+            _, first = np.unique(indices, return_index=True)
+            indices = indices[np.sort(first)]
+            return self.recommendations_frame(indices).drop_duplicates().head(k)
+
+    @metrics.timed("recommender_recommend_many")
+    def recommend_many(self, queries, k=10):
+        # Empfehlungen für viele exakte Titel auf einmal, z.B. für den nächtlichen Katalog-Export.
+        # Liefert Index- und Score-Arrays (len(queries) × k), nicht gefundene Titel bzw. Plätze sind -1 / NaN.
+        rows = np.array([self.title_rows.get(title, -1) for title in queries], dtype=np.int64)
+        found = np.flatnonzero(rows >= 0)
+        indices = np.full((len(rows), k), -1, dtype=np.int32)
+        scores = np.full((len(rows), k), np.nan, dtype=np.float32)
+        indices[found], scores[found] = self.neighbors_for_rows(rows[found], k)
+        return indices, scores
 
+    def neighbors_for_rows(self, rows, k):
+        # Nachbarn als (len(rows) × k) Index-/Score-Arrays, fehlende Plätze sind -1 / NaN
+        indices = np.full((len(rows), k), -1, dtype=np.int32)
+        scores = np.full((len(rows), k), np.nan, dtype=np.float32)
+        if self.mode == "ann":
+            for i, row in enumerate(rows):
+                row_indices, row_scores = self.ann_neighbors(row, k)
+                indices[i, :len(row_indices)] = row_indices
+                scores[i, :len(row_scores)] = row_scores
+        elif k <= self.neighbor_indices.shape[1]:
+            indices[:] = self.neighbor_indices[rows, :k]
+            scores[:] = self.neighbor_scores[rows, :k]
+        else:
+            # Mehr Nachbarn als im Index: exakt und blockweise aus den Sparse-Matrizen berechnen
+            transposed = self.transposed_matrices()
+            for start in range(0, len(rows), self.block_size):
+                block = slice(start, start + self.block_size)
+                block_indices, block_scores = self.top_neighbors(rows[block], k, transposed)
+                indices[block, :block_indices.shape[1]] = block_indices
+                scores[block, :block_scores.shape[1]] = block_scores
+        return indices, scores
 
+    def recommendations_frame(self, indices):
+        # DataFrames werden erst am Rand gebaut
+        indices = np.asarray(indices)
+        return self.df.iloc[indices[indices >= 0]][["title", "description"]]
@@ -0,0 +1,306 @@
+"""Betrieb mit mehreren Worker-Prozessen und einem gemeinsamen, schreibgeschützten Modell.
+
+Das Modellartefakt wird genau einmal gebaut, vorab per Kommandozeile oder vom ersten Worker unter
+einer Dateisperre. Alle Worker laden es danach per mmap. Matrizen und Nachbarlisten liegen so nur
+einmal im Page-Cache des Betriebssystems:
+
+    python serving.py df_stream.csv
+    gunicorn --workers 4 --threads 8 dashboard:server
+
+Gunicorn verteilt die Callbacks einer Sitzung beliebig auf die Worker. Suchergebnisse liegen daher nur
+als Zwischenspeicher im Worker, der dcc.Store enthält zusätzlich die Anfrage. Ein anderer Worker
+berechnet das Ergebnis daraus beim Blättern neu.
+
+Nicht alles ist geteilt: df.pkl (mit den Beschreibungen) und die Vektorisierer samt Vokabular werden in
+jedem Worker entpickelt, TitleIndex und FilterIndex in jedem Worker neu aufgebaut. Diese Teile belegen
+den Speicher also einmal pro Worker, nur die dünnbesetzten Matrizen, die Nachbarlisten und die
+ANN-Vektoren liegen per mmap gemeinsam im Page-Cache.
+
+Der ModelManager baut das Modell im Hintergrund und tauscht neue Versionen im laufenden Betrieb aus,
+ausgelöst über POST /model/reload oder eine geänderte CSV-Datei.
+"""
+import argparse
+import fcntl
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+import metrics
+from catalog import load_catalog
+from recommendation import MovieRecommender
+from title_index import TitleIndex
+
+
+@contextmanager
+def build_lock(cache_dir):
+    # Exklusive Sperre über alle Prozesse, die dasselbe Cache-Verzeichnis nutzen
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, '.build.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def secret_key(path='.flask_secret'):
+    """Gemeinsamer Schlüssel für die signierten Sitzungscookies aller Worker.
+
+    Vorrang hat DASHBOARD_SECRET_KEY, sonst legt der erste Worker die Datei exklusiv an und die übrigen lesen sie.
+    """
+    key = os.environ.get('DASHBOARD_SECRET_KEY')
+    if key:
+        return key
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Der andere Worker schreibt eventuell gerade noch
+        for _ in range(50):
+            with open(path) as f:
+                key = f.read().strip()
+            if key:
+                return key
+            time.sleep(0.1)
+        raise RuntimeError(f'{path} ist leer, bitte löschen oder DASHBOARD_SECRET_KEY setzen')
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+    return key
+
+
+def build_artifact(csv_path, cache_dir='model_cache', **kwargs):
+    """Modellartefakt bauen, falls es noch fehlt, und sein Verzeichnis zurückgeben."""
+    model = MovieRecommender(**kwargs)
+    artifact_dir = os.path.join(cache_dir, model.cache_key(csv_path))
+    with build_lock(cache_dir):
+        # Wer auf die Sperre gewartet hat, findet das Artefakt des anderen Prozesses bereits vor
+        if not os.path.exists(os.path.join(artifact_dir, 'meta.json')):
+            model.load_csv(csv_path)
+            model.fit()
+            model.save(artifact_dir)
+    return artifact_dir
+
+
+def attach_model(csv_path, cache_dir='model_cache', **kwargs):
+    """Gemeinsames Modell für diesen Worker, die großen Arrays werden nur eingeblendet, nicht kopiert."""
+    return MovieRecommender.load(build_artifact(csv_path, cache_dir, **kwargs), mmap=True, **kwargs)
+
+
+class RecommendationService:
+    """Führt recommend() in einem Thread-Pool aus.
+
+    Langsame Suchen belegen so höchstens max_workers Threads und blockieren andere Callbacks nicht.
+    Gleichzeitige Anfragen mit demselben Suchbegriff teilen sich eine Berechnung.
+    """
+
+    TIMEOUT_MESSAGE = "Die Suche hat zu lange gedauert. Bitte versuchen Sie es erneut"
+
+    def __init__(self, model, max_workers=4, timeout=30.0):
+        self.model = model
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recommend')
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.stats = {'submitted': 0, 'coalesced': 0, 'timeouts': 0}
+
+    def submit(self, search_query, k=10):
+        key = (search_query, k)
+        with self.lock:
+            future = self.pending.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future
+            future = self.executor.submit(self.model.recommend, search_query, k)
+            self.pending[key] = future
+            self.stats['submitted'] += 1
+        future.add_done_callback(lambda done: self.discard(key, done))
+        return future
+
+    def discard(self, key, future):
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    def recommend(self, search_query, k=10):
+        future = self.submit(search_query, k)
+        try:
+            with metrics.timer('recommendation_service_wait'):
+                return future.result(timeout=self.timeout)
+        except TimeoutError:
+            with self.lock:
+                self.stats['timeouts'] += 1
+            return self.TIMEOUT_MESSAGE
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self.pending)
+        stats['queued'] = self.executor._work_queue.qsize()
+        return stats
+
+
+class ModelManager:
+    """Hält das aktuelle Modell und baut neue Versionen in einem Hintergrund-Thread.
+
+    Bis das erste Modell geladen ist, liefert recommend() reine Titeltreffer aus dem Katalog. Ein
+    fertiges Modell ersetzt das alte mit einer einzigen Zuweisung. Laufende Anfragen rechnen mit dem
+    Modell weiter, das sie bereits in der Hand haben.
+    """
+
+    WARMING_UP_MESSAGE = "Die Empfehlungen werden gerade vorbereitet. Bitte versuchen Sie es gleich erneut"
+
+    def __init__(self, csv_path, cache_dir='model_cache', poll_interval=None, **kwargs):
+        self.csv_path = csv_path
+        self.cache_dir = cache_dir
+        # Sekunden zwischen zwei Prüfungen der CSV-Datei, None schaltet die Überwachung ab
+        self.poll_interval = poll_interval
+        self.kwargs = kwargs
+        self.model = None
+        self.fallback = None
+        self.version = None
+        self.generation = 0
+        self.loaded_at = None
+        self.last_error = None
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.build_thread = None
+        self.stats = {'builds': 0, 'failures': 0, 'fallback_failures': 0, 'fallback_queries': 0}
+
+    def start(self):
+        self.reload()
+        if self.poll_interval:
+            threading.Thread(target=self.watch, name='model-watch', daemon=True).start()
+        return self
+
+    def add_listener(self, listener):
+        # listener(model, generation) wird nach jedem Austausch aufgerufen
+        self.listeners.append(listener)
+
+    def reload(self):
+        # Neuaufbau im Hintergrund starten, außer es läuft bereits einer
+        with self.lock:
+            if self.build_thread is not None and self.build_thread.is_alive():
+                return False
+            self.build_thread = threading.Thread(target=self.build, name='model-build', daemon=True)
+            self.build_thread.start()
+        return True
+
+    def build(self):
+        if self.model is None and self.fallback is None:
+            try:
+                self.build_fallback()
+            except Exception as e:
+                # Ohne Titelsuche für die Wartezeit weiter, das eigentliche Modell wird trotzdem gebaut
+                with self.lock:
+                    self.stats['fallback_failures'] += 1
+                    self.last_error = repr(e)
+        try:
+            with metrics.timer('model_build'):
+                artifact_dir = build_artifact(self.csv_path, self.cache_dir, **self.kwargs)
+                model = MovieRecommender.load(artifact_dir, mmap=True, **self.kwargs)
+            self.swap(model, os.path.basename(artifact_dir))
+        except Exception as e:
+            # Das bisherige Modell bleibt aktiv
+            metrics.registry.increment('model_build_failures_total')
+            with self.lock:
+                self.stats['failures'] += 1
+                self.last_error = repr(e)
+
+    def build_fallback(self):
+        catalog = load_catalog(self.csv_path)
+        movies = catalog[catalog['type'] == 'MOVIE'].drop_duplicates('title')
+        self.fallback = (TitleIndex(movies['title'].tolist()), movies.set_index('title')['description'])
+
+    def swap(self, model, version):
+        with self.lock:
+            self.model = model
+            self.version = version
+            self.generation += 1
+            self.loaded_at = time.time()
+            self.stats['builds'] += 1
+            generation = self.generation
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(model, generation)
+
+    def watch(self):
+        last_seen = self.csv_signature()
+        while True:
+            time.sleep(self.poll_interval)
+            signature = self.csv_signature()
+            if signature is not None and signature != last_seen and self.reload():
+                last_seen = signature
+
+    def csv_signature(self):
+        try:
+            stat = os.stat(self.csv_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def recommend(self, search_query, k=10):
+        model = self.model
+        if model is not None:
+            return model.recommend(search_query, k)
+        fallback = self.fallback
+        if fallback is None or not isinstance(search_query, str):
+            return self.WARMING_UP_MESSAGE
+        # Noch kein Modell: die Filme mit den ähnlichsten Titeln anzeigen
+        with self.lock:
+            self.stats['fallback_queries'] += 1
+        title_index, descriptions = fallback
+        titles = [title for title, *_ in title_index.extract(search_query, limit=k)]
+        return descriptions.loc[titles].reset_index()[['title', 'description']]
+
+    def current(self):
+        # Modell und Version immer als zusammengehöriges Paar lesen
+        with self.lock:
+            return self.model, self.version
+
+    def cache_stats(self):
+        model = self.model
+        return model.cache.stats() if model is not None else {}
+
+    def title_index_stats(self):
+        model = self.model
+        return model.title_index.get_stats() if model is not None else {}
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats.update(ready=self.model is not None, generation=self.generation, loaded_at=self.loaded_at or 0.0,
+                         building=self.build_thread is not None and self.build_thread.is_alive())
+        return stats
+
+    def status(self):
+        stats = self.get_stats()
+        stats.update(version=self.version, last_error=self.last_error)
+        return stats
+
+
+def register_routes(server, manager):
+    """GET /model meldet Version und Zustand, POST /model/reload startet einen Neuaufbau."""
+    from flask import jsonify
+
+    @server.route('/model')
+    def model_status():
+        return jsonify(manager.status())
+
+    @server.route('/model/reload', methods=['POST'])
+    def model_reload():
+        started = manager.reload()
+        return jsonify({'started': started, **manager.status()}), 202 if started else 409
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path')
+    parser.add_argument('--cache-dir', default='model_cache')
+    args = parser.parse_args()
+    print(f'Modellartefakt in {build_artifact(args.csv_path, args.cache_dir)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+import metrics
+from recommendation import top_k
+
+# Bonus je erfüllter Vorliebe, größer als jeder hybride Score, damit passende Filme immer vorne liegen
+PREFERENCE_BONUS = 1000.0
+
+
+def row_sum(matrix, rows):
+    # Summe der angegebenen Zeilen als 1 × n_features Sparse-Vektor
+    return sparse.csr_matrix(np.ones((1, len(rows)), dtype=matrix.dtype)) @ matrix[rows]
+
+
+def encode_vectors(*vectors):
+    buffer = io.BytesIO()
+    arrays = {}
+    for i, vector in enumerate(vectors):
+        vector = sparse.csr_matrix(vector)
+        arrays[f'indices_{i}'] = vector.indices.astype(np.int32)
+        arrays[f'values_{i}'] = vector.data.astype(np.float32)
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def decode_vectors(blob, n_features):
+    arrays = np.load(io.BytesIO(blob))
+    vectors = []
+    for i, width in enumerate(n_features):
+        indices, values = arrays[f'indices_{i}'], arrays[f'values_{i}']
+        vectors.append(sparse.csr_matrix((values, indices, [0, len(indices)]), shape=(1, width)))
+    return vectors
+
+
+class TasteProfiles:
+    """Persönliche Empfehlungen aus Lieblingsgenre, Lieblingsdienst und den gesuchten Titeln.
+
+    Das Profil besteht aus den summierten TF-IDF- und Metadatenvektoren der gesuchten Filme sowie dem
+    Lieblingsgenre im Metadatenraum. Der Katalog wird mit einem Produkt Matrix × Vektor bewertet, eine
+    Maske auf Genre und Streaming-Dienst zieht passende Filme nach vorne. Profil und Top-N-Liste liegen in
+    user_profiles und werden bei jeder neuen Suche fortgeschrieben statt neu aufgebaut.
+    """
+
+    def __init__(self, user_store, top_n=50, genre_weight=1.0, max_searches=50):
+        self.user_store = user_store
+        self.top_n = top_n
+        self.genre_weight = genre_weight
+        self.max_searches = max_searches
+        # Profil-Updates laufen nacheinander und außerhalb der Dash-Callbacks
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='taste-profiles')
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'rebuilds': 0, 'updates': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def recommendations(self, model, version, user):
+        """Top-N-Filme für einen Nutzer (Zeile aus users), direkt nach dem Login."""
+        with metrics.timer('taste_profile_recommendations'):
+            return model.recommendations_frame(self.load(model, version, user)['top_rows'])
+
+    def record_search(self, model, version, user_id, search_query):
+        # Der Nutzer wird erst im Hintergrund nachgeschlagen, der Callback wartet auf keine Abfrage
+        return self.executor.submit(self.update, model, version, user_id, search_query)
+
+    def load(self, model, version, user):
+        stored = self.user_store.get_profile(user[0])
+        searched = json.loads(stored[0]) if stored is not None else []
+        if stored is not None and stored[1] == version:
+            self.count('hits')
+            tfidf_sum, count_sum = decode_vectors(stored[2], self.n_features(model))
+            return {'searched': searched, 'tfidf_sum': tfidf_sum, 'count_sum': count_sum,
+                    'top_rows': np.frombuffer(stored[3], dtype=np.int32)}
+        # Kein Profil oder ein anderes Modell: Vektoren aus den gespeicherten Titeln neu aufbauen
+        self.count('rebuilds')
+        rows = self.searched_rows(model, searched)
+        profile = {'searched': searched, 'tfidf_sum': row_sum(model.tfidf_matrix, rows),
+                   'count_sum': row_sum(model.count_normalized, rows)}
+        self.rank_and_save(model, version, user, profile)
+        return profile
+
+    def update(self, model, version, user_id, search_query):
+        title = self.resolve(model, search_query)
+        if title is None:
+            return
+        user = self.user_store.get_user(user_id)
+        if user is None:
+            return
+        self.count('updates')
+        profile = self.load(model, version, user)
+        if title in profile['searched']:
+            # Erneute Suche: nur ans Ende rücken, die Summen enthalten den Film bereits
+            profile['searched'].remove(title)
+            profile['searched'].append(title)
+            self.save(version, user, profile)
+            return
+        row = [model.title_rows[title]]
+        profile['searched'].append(title)
+        profile['tfidf_sum'] = profile['tfidf_sum'] + row_sum(model.tfidf_matrix, row)
+        profile['count_sum'] = profile['count_sum'] + row_sum(model.count_normalized, row)
+        if len(profile['searched']) > self.max_searches:
+            # Die älteste Suche fällt heraus und wird von den Summen abgezogen
+            dropped = self.searched_rows(model, [profile['searched'].pop(0)])
+            profile['tfidf_sum'] = profile['tfidf_sum'] - row_sum(model.tfidf_matrix, dropped)
+            profile['count_sum'] = profile['count_sum'] - row_sum(model.count_normalized, dropped)
+        self.rank_and_save(model, version, user, profile)
+
+    def rank_and_save(self, model, version, user, profile):
+        searched_rows = self.searched_rows(model, profile['searched'])
+        n_searched = max(len(searched_rows), 1)
+        genre_vector = normalize(model.count.transform([user[3] or '']))
+        scores = model.profile_scores(profile['tfidf_sum'] / n_searched,
+                                      profile['count_sum'] / n_searched + self.genre_weight * genre_vector)
+        # Bei Gleichstand gewinnt die bessere IMDb-Bewertung
+        scores += 1e-6 * np.nan_to_num(model.filter_index.imdb_score)
+        if user[4]:
+            scores[model.filter_index.query(service=user[4])] += PREFERENCE_BONUS
+        if user[3]:
+            scores[model.filter_index.query(genres=[user[3]])] += PREFERENCE_BONUS
+        scores[searched_rows] = -np.inf
+        top_rows, _ = top_k(scores[np.newaxis, :], self.top_n)
+        profile['top_rows'] = top_rows[0]
+        self.save(version, user, profile)
+
+    def save(self, version, user, profile):
+        self.user_store.save_profile(user[0], json.dumps(profile['searched']), version,
+                                     encode_vectors(profile['tfidf_sum'], profile['count_sum']),
+                                     profile['top_rows'].astype(np.int32).tobytes())
+
+    def resolve(self, model, search_query):
+        # Die Suche auf den Titel abbilden, den auch recommend() als besten Treffer verwendet
+        if not isinstance(search_query, str):
+            return None
+        if search_query in model.title_rows:
+            return search_query
+        matches = model.title_index.extract(search_query, limit=1)
+        return matches[0][0] if matches else None
+
+    @staticmethod
+    def searched_rows(model, titles):
+        return [model.title_rows[title] for title in titles if title in model.title_rows]
+
+    @staticmethod
+    def n_features(model):
+        return model.tfidf_matrix.shape[1], model.count_normalized.shape[1]
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['pending_updates'] = self.executor._work_queue.qsize()
+        return stats
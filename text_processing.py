@@ -0,0 +1,65 @@
+import string
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from cleantext import clean
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+from nltk.stem import WordNetLemmatizer
+
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
+
+class TextPreprocessor:
+    """Gemeinsame Textvorverarbeitung für Empfehlung und Visualisierung.
+
+    Stoppwörter und Lemmatizer werden nur einmal geladen, Lemmata pro Token zwischengespeichert.
+    """
+
+    def __init__(self, no_emoji=False, n_jobs=1, chunk_size=2000):
+        self.no_emoji = no_emoji
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.stop_words = set(stopwords.words("english"))
+        self.lemmatizer = WordNetLemmatizer()
+        self.lemma_cache = {}
+
+    def lemmatize(self, token):
+        lemma = self.lemma_cache.get(token)
+        if lemma is None:
+            lemma = self.lemmatizer.lemmatize(token)
+            self.lemma_cache[token] = lemma
+        return lemma
+
+    def process(self, text):
+        text = clean(text, no_emoji=self.no_emoji).lower().translate(PUNCTUATION_TABLE)
+        tokens = word_tokenize(text)
+        return ' '.join(self.lemmatize(w) for w in tokens if w not in self.stop_words)
+
+    def process_many(self, texts):
+        return [self.process(text) for text in texts]
+
+    def process_column(self, column):
+        texts = list(column)
+        if self.n_jobs > 1 and len(texts) > self.chunk_size:
+            # Große Korpora werden in Blöcken auf einen Prozesspool verteilt
+            chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+            with ProcessPoolExecutor(max_workers=self.n_jobs) as pool:
+                results = pool.map(process_chunk, [self.no_emoji] * len(chunks), chunks)
+                processed = [text for chunk in results for text in chunk]
+        else:
+            processed = self.process_many(texts)
+        return pd.Series(processed, index=column.index, name=column.name)
+
+
+_shared_preprocessors = {}
+
+
+def get_preprocessor(no_emoji=False):
+    # Eine Instanz pro Prozess und Einstellung, damit der Lemma-Cache wiederverwendet wird
+    if no_emoji not in _shared_preprocessors:
+        _shared_preprocessors[no_emoji] = TextPreprocessor(no_emoji=no_emoji)
+    return _shared_preprocessors[no_emoji]
+
+
+def process_chunk(no_emoji, texts):
+    return get_preprocessor(no_emoji).process_many(texts)
@@ -0,0 +1,159 @@
+import heapq
+import time
+from collections import defaultdict
+from functools import partial
+import numpy as np
+from fuzzywuzzy import fuzz, process, utils
+
+
+# Zeichen nach utils.full_process(force_ascii=True); alles andere landet in einer gemeinsamen letzten Spalte
+ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789_ "
+CHAR_CODES = {char: code for code, char in enumerate(ALPHABET)}
+
+
+def title_grams(processed, n=3):
+    padded = f" {processed} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def char_counts(processed):
+    counts = np.zeros(len(ALPHABET) + 1, dtype=np.int16)
+    for char in processed:
+        counts[CHAR_CODES.get(char, len(ALPHABET))] += 1
+    return counts
+
+
+class TitleIndex:
+    """Zeichen-n-Gramm-Index über die Filmtitel für die unscharfe Titelsuche.
+
+    Eine Anfrage wird über gemeinsame n-Gramme auf wenige Kandidaten eingegrenzt,
+    die dann wie bei fuzzywuzzy.process.extract mit WRatio bewertet werden. WRatio bewertet
+    kurze Titel über Teilstrings auch ohne viele gemeinsame n-Gramme hoch. Deshalb erhält jeder
+    aussortierte Titel eine obere Schranke seines Scores aus den gemeinsamen Zeichen; wer den
+    schwächsten der besten Treffer noch erreichen kann, wird ebenfalls bewertet. Das Ergebnis
+    ist so dasselbe wie bei process.extract.
+    """
+
+    def __init__(self, titles, min_overlap=0.34):
+        # Anteil der n-Gramme (bezogen auf den kürzeren der beiden Strings), den ein Titel mit der Anfrage
+        # mindestens teilen muss, um bewertet zu werden. WRatio bewertet auch Teilstrings hoch.
+        self.min_overlap = min_overlap
+        self.stats = {"build_seconds": 0.0, "queries": 0, "query_seconds_total": 0.0,
+                      "last_query_seconds": 0.0, "candidates_total": 0, "bound_candidates_total": 0, "full_scans": 0}
+        self.titles = []
+        self.processed = []
+        self.gram_counts = np.empty(0, dtype=np.int32)
+        self.postings = defaultdict(list)
+        # Für die Schranke: Zeichenhäufigkeiten, Länge ohne Leerzeichen und Titel je ganzem Wort
+        self.char_counts = np.empty((0, len(ALPHABET) + 1), dtype=np.int16)
+        self.lengths = np.empty(0, dtype=np.int32)
+        self.token_postings = defaultdict(list)
+        self.add(titles)
+
+    def add(self, titles):
+        start = time.perf_counter()
+        gram_counts = []
+        counts = []
+        for title in titles:
+            row = len(self.titles)
+            processed = utils.full_process(title, force_ascii=True) if isinstance(title, str) else ""
+            self.titles.append(title)
+            self.processed.append(processed)
+            grams = title_grams(processed)
+            gram_counts.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(row)
+            for token in set(processed.split()):
+                self.token_postings[token].append(row)
+            counts.append(char_counts(processed))
+        self.gram_counts = np.concatenate([self.gram_counts, np.asarray(gram_counts, dtype=np.int32)])
+        if counts:
+            self.char_counts = np.vstack([self.char_counts, counts])
+            self.lengths = self.char_counts[:, :-2].sum(axis=1, dtype=np.int32) + self.char_counts[:, -1]
+        self.stats["build_seconds"] += time.perf_counter() - start
+        self.stats["n_titles"] = len(self.titles)
+        self.stats["n_grams"] = len(self.postings)
+
+    def candidates(self, processed_query):
+        query_grams = title_grams(processed_query)
+        grams = [gram for gram in query_grams if gram in self.postings]
+        if not grams:
+            return np.empty(0, dtype=np.int64)
+        overlap = np.bincount(np.concatenate([self.postings[gram] for gram in grams]), minlength=len(self.titles))
+        required = np.maximum(np.ceil(self.min_overlap * np.minimum(self.gram_counts, len(query_grams))), 1)
+        # Reihenfolge wie in der Titelliste, damit Gleichstände wie bei process.extract aufgelöst werden
+        return np.flatnonzero(overlap >= required)
+
+    def score_bounds(self, processed_query):
+        """Obere Schranke von WRatio(Anfrage, Titel) für alle Titel.
+
+        Alle Teilbewertungen von WRatio sind Ähnlichkeiten 2M / (Länge a + Länge b) zwischen Strings aus
+        den Zeichen beider Seiten, M ist höchstens die Zahl gemeinsamer Zeichen. Über die Sortierung der
+        Wörter und Teilstrings kann die kürzere Seite bis auf ihre Zeichen ohne Leerzeichen schrumpfen.
+        Ein gemeinsames ganzes Wort kann über token_set_ratio bis zu 100 ergeben.
+        """
+        query_counts = char_counts(processed_query)
+        common = np.minimum(self.char_counts, query_counts).sum(axis=1, dtype=np.float64)
+        query_length = query_counts[:-2].sum() + query_counts[-1]
+        shorter = np.minimum(self.lengths, query_length)
+        # Teilstring-Bewertungen nutzt WRatio erst ab einem Längenverhältnis von 1.5, ab 8 mit Faktor 0.6
+        full_lengths = self.char_counts.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            len_ratio = np.maximum(full_lengths, len(processed_query)) / np.minimum(full_lengths, len(processed_query))
+            scale = np.where(len_ratio >= 1.5, np.where(len_ratio > 8, 0.6, 0.9), 0.0)
+            whole = np.nan_to_num(200 * common / (self.lengths + query_length))
+            partial = np.nan_to_num(scale * 200 * common / (shorter + common))
+        bounds = np.minimum(np.maximum(whole, partial), 100)
+        for token in set(processed_query.split()):
+            bounds[self.token_postings.get(token, [])] = 100
+        # Gerundete Zwischenergebnisse in fuzzywuzzy: ein Punkt Reserve
+        return bounds + 1
+
+    def extract(self, query, limit=10):
+        start = time.perf_counter()
+        processed_query = utils.full_process(query, force_ascii=True)
+        rows = self.candidates(processed_query) if len(processed_query) > 3 else []
+        if len(rows) < limit:
+            # Sehr kurze Anfragen oder zu wenige Kandidaten: auf den vollständigen Vergleich zurückfallen
+            self.stats["full_scans"] += 1
+            matches = process.extract(query, self.titles, limit=limit)
+        else:
+            scorer = partial(fuzz.WRatio, full_process=False)
+            # Gleiche Titel (z.B. Remakes) werden nur einmal bewertet
+            scores = {}
+
+            def score(rows):
+                for row in rows:
+                    processed = self.processed[row]
+                    if processed not in scores:
+                        scores[processed] = scorer(processed_query, processed)
+                return heapq.nlargest(limit, ((row, scores[self.processed[row]]) for row in rows),
+                                      key=lambda match: match[1])
+
+            weakest = score(rows)[-1][1]
+            # Aussortierte Titel, die den schwächsten Treffer noch erreichen könnten, ebenfalls bewerten
+            pruned = np.ones(len(self.titles), dtype=bool)
+            pruned[rows] = False
+            extra = np.flatnonzero(pruned & (self.score_bounds(processed_query) >= weakest))
+            self.stats["bound_candidates_total"] += len(extra)
+            rows = np.union1d(rows, extra)
+            matches = [(self.titles[row], value) for row, value in score(rows)]
+        elapsed = time.perf_counter() - start
+        self.stats["queries"] += 1
+        self.stats["query_seconds_total"] += elapsed
+        self.stats["last_query_seconds"] = elapsed
+        self.stats["candidates_total"] += len(rows)
+        return matches
+
+    def parity_report(self, queries, limit=10):
+        """Vergleicht extract() mit process.extract über den vollständigen Titelbestand."""
+        mismatches = [query for query in queries
+                      if self.extract(query, limit) != process.extract(query, self.titles, limit=limit)]
+        return {"queries": len(queries), "mismatches": len(mismatches), "examples": mismatches[:5]}
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        queries = max(stats["queries"], 1)
+        stats["avg_query_seconds"] = stats["query_seconds_total"] / queries
+        stats["avg_candidates"] = stats["candidates_total"] / queries
+        return stats
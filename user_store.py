@@ -0,0 +1,124 @@
+import sqlite3
+import threading
+import time
+import metrics
+
+CREATE_USERS_TABLE = '''CREATE TABLE IF NOT EXISTS users
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  username TEXT UNIQUE,
+                  password TEXT,
+                  favorite_genre TEXT,
+                  favorite_streaming_service TEXT)'''
+# username ist UNIQUE, SQLite legt dafür bereits sqlite_autoindex_users_1 an. Ein früher angelegter
+# zusätzlicher Index war doppelt und verlangsamte nur jedes INSERT.
+DROP_USERNAME_INDEX = 'DROP INDEX IF EXISTS idx_users_username'
+# Geschmacksprofil je Nutzer: gesuchte Titel (JSON), Profilvektor und Top-N-Liste als kompakte Binärdaten.
+# model_version gibt an, zu welchem Modell Vektor und Liste gehören.
+CREATE_PROFILES_TABLE = '''CREATE TABLE IF NOT EXISTS user_profiles
+                 (user_id INTEGER PRIMARY KEY REFERENCES users (id),
+                  searched TEXT,
+                  model_version TEXT,
+                  vector BLOB,
+                  top_rows BLOB)'''
+SELECT_USER = 'SELECT * FROM users WHERE username=? AND password=?'
+SELECT_USER_BY_ID = 'SELECT * FROM users WHERE id=?'
+INSERT_USER = '''INSERT INTO users (username, password, favorite_genre, favorite_streaming_service)
+                 VALUES (?, ?, ?, ?)'''
+SELECT_PROFILE = 'SELECT searched, model_version, vector, top_rows FROM user_profiles WHERE user_id=?'
+UPSERT_PROFILE = '''INSERT INTO user_profiles (user_id, searched, model_version, vector, top_rows)
+                 VALUES (?, ?, ?, ?, ?)
+                 ON CONFLICT (user_id) DO UPDATE SET searched=excluded.searched, model_version=excluded.model_version,
+                 vector=excluded.vector, top_rows=excluded.top_rows'''
+
+
+class UserStore:
+    """Zugriff auf die Benutzerdatenbank mit einer Verbindung pro Thread.
+
+    Die Datenbank läuft im WAL-Modus, damit Lesezugriffe nicht von Schreibzugriffen blockiert werden.
+    Bei "database is locked" wird mit wachsender Wartezeit erneut versucht.
+    """
+
+    def __init__(self, db_path='userdata.db', busy_timeout=5.0, retries=5, retry_delay=0.05):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.local = threading.local()
+        self.stats_lock = threading.Lock()
+        self.stats = {'queries': 0, 'seconds_total': 0.0, 'max_seconds': 0.0, 'retries': 0, 'lock_errors': 0}
+        self.initialize()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # Kompilierte Statements werden pro Verbindung anhand des SQL-Strings wiederverwendet
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, cached_statements=64)
+            conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}')
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def initialize(self):
+        self.execute(CREATE_USERS_TABLE, commit=True)
+        self.execute(DROP_USERNAME_INDEX, commit=True)
+        self.execute(CREATE_PROFILES_TABLE, commit=True)
+        # Sicherstellen, dass der Login über den UNIQUE-Index auf username läuft
+        plan = self.connection().execute('EXPLAIN QUERY PLAN ' + SELECT_USER, ('', '')).fetchall()
+        self.login_uses_index = any('USING INDEX' in row[-1] for row in plan)
+
+    def execute(self, sql, params=(), commit=False):
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                conn = self.connection()
+                cursor = conn.execute(sql, params)
+                row = cursor.fetchone()
+                if commit:
+                    conn.commit()
+                break
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                self.connection().rollback()
+                with self.stats_lock:
+                    self.stats['lock_errors'] += 1
+                if attempt == self.retries:
+                    raise
+                with self.stats_lock:
+                    self.stats['retries'] += 1
+                time.sleep(self.retry_delay * 2 ** attempt)
+        elapsed = time.perf_counter() - start
+        metrics.registry.observe('sqlite_query_seconds', elapsed)
+        with self.stats_lock:
+            self.stats['queries'] += 1
+            self.stats['seconds_total'] += elapsed
+            self.stats['max_seconds'] = max(self.stats['max_seconds'], elapsed)
+        return row
+
+    def authenticate(self, username, password):
+        return self.execute(SELECT_USER, (username, password))
+
+    def get_user(self, user_id):
+        return self.execute(SELECT_USER_BY_ID, (user_id,))
+
+    def register(self, username, password, favorite_genre, favorite_streaming_service):
+        try:
+            self.execute(INSERT_USER, (username, password, favorite_genre, favorite_streaming_service), commit=True)
+        except sqlite3.IntegrityError:
+            self.connection().rollback()
+            return False
+        return True
+
+    def get_profile(self, user_id):
+        return self.execute(SELECT_PROFILE, (user_id,))
+
+    def save_profile(self, user_id, searched, model_version, vector, top_rows):
+        self.execute(UPSERT_PROFILE, (user_id, searched, model_version, vector, top_rows), commit=True)
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats['avg_seconds'] = stats['seconds_total'] / max(stats['queries'], 1)
+        stats['login_uses_index'] = self.login_uses_index
+        return stats